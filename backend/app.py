@@ -1,10 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, make_response, Response, stream_with_context
 from flask_cors import CORS
 import logging
 import os
+import json
+import base64
+import hashlib
+import time
+import threading
+from functools import wraps
 from datetime import datetime
 from database import db_manager
-from config import DATABASE_TYPE
+from cache import response_cache, CacheCoherence
+from aulas_storage import aulas_store
+from write_queue import WriteQueue, WriteRejected
+from json_provider import FastJSONProvider
+from compression import compressor, etag_variants
+from frontend import register_frontend
+from events import (
+    EventFeed, Mudanca, para_intervalos,
+    CURSO_CRIADO, CURSO_ATUALIZADO, CURSO_REMOVIDO, AULAS_ATUALIZADAS
+)
+from config import DATABASE_TYPE, SERVE_FRONTEND, CORS_MAX_AGE, EVENTS_MAX_WSGI_STREAMS
 
 # Configure logging
 logging.basicConfig(
@@ -15,6 +31,7 @@ logger = logging.getLogger(__name__)
 
 # Inicialização do Flask
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson quando instalado (ver json_provider.py)
 
 # Configuração robusta do CORS para Vue.js dev server
 CORS(app, resources={
@@ -36,13 +53,24 @@ CORS(app, resources={
             "http://127.0.0.1:8080"   # Alternative
         ],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Accept"]
+        "allow_headers": ["Content-Type", "Authorization", "Accept", "If-None-Match", "Last-Event-ID"],
+        "expose_headers": ["ETag", "Retry-After", "Server-Timing"],
+        "max_age": CORS_MAX_AGE  # Um preflight por recurso, não um por escrita
     }
 })
 
+# Compressão gzip/brotli negociada das respostas da API
+compressor.init_app(app)
+
 # Configurações do banco de dados
 logger.info(f"Usando banco de dados: {DATABASE_TYPE.upper()}")
 
+# Coerência do cache entre processos (workers) via arquivo SQLite
+cache_coherence = CacheCoherence(response_cache, db_manager.new_connection)
+
+# Feed de alterações publicado em /api/events (Server-Sent Events)
+event_feed = EventFeed(db_manager.new_connection)
+
 # ===============================
 # HELPER FUNCTIONS
 # ===============================
@@ -82,42 +110,155 @@ def create_success_response(data, message=None, status_code=200):
         
     return jsonify(response_data), status_code
 
+def create_overload_response(erro):
+    """
+    Resposta 503 para escritas recusadas pelo controle de admissão.
+    O cliente deve repetir a requisição após Retry-After segundos.
+    """
+    response, status_code = create_error_response(
+        "Servidor sobrecarregado, tente novamente em instantes",
+        503,
+        erro.reason
+    )
+    response.headers['Retry-After'] = str(erro.retry_after)
+    return response, status_code
+
 def get_db_connection():
     """
-    Estabelece conexão com o banco de dados com tratamento de erros.
+    Obtém uma conexão do pool para a requisição atual com tratamento de erros.
+    A conexão volta ao pool em conn.close() ou, no mais tardar, ao fim da requisição.
     """
     try:
-        return db_manager.get_connection()
+        conn = db_manager.get_connection()
     except Exception as e:
         logger.error(f"Erro ao conectar com o banco de dados: {str(e)}")
         raise Exception(f"Falha na conexão com o banco de dados: {str(e)}")
+    
+    g.setdefault('db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    """
+    Devolve ao pool as conexões que a requisição não fechou explicitamente.
+    """
+    for conn in g.pop('db_connections', []):
+        try:
+            conn.close()
+        except Exception as close_error:
+            logger.error(f"Erro ao devolver conexão ao pool: {str(close_error)}")
 
 def get_curso_aulas_concluidas(connection, curso_id):
     """
     Retorna o número de aulas concluídas para um curso específico.
     """
     try:
-        # Simplified for SQLite only
-        query = "SELECT COUNT(*) as count FROM aulas_concluidas WHERE curso_id = ?"
+        # Contador mantido por triggers em aulas_concluidas
+        query = "SELECT aulas_concluidas_count FROM cursos WHERE id = ?"
         result = db_manager.execute_query(connection, query, (curso_id,), fetch_one=True)
-        return result['count'] if result else 0
+        return result['aulas_concluidas_count'] if result else 0
     except Exception as e:
         logger.error(f"Erro ao buscar aulas concluídas para curso {curso_id}: {str(e)}")
         raise Exception(f"Erro ao consultar aulas concluídas")
 
-def get_aulas_concluidas_list(connection, curso_id):
+def get_aulas_concluidas_list(connection, curso_id, formato='list'):
     """
     Retorna lista das aulas concluídas para um curso específico.
+    Com formato='ranges', retorna intervalos [inicio, fim] de aulas consecutivas.
     """
     try:
-        # Simplified for SQLite only
-        query = "SELECT numero_aula FROM aulas_concluidas WHERE curso_id = ? ORDER BY numero_aula"
-        results = db_manager.execute_query(connection, query, (curso_id,), fetch_all=True)
-        return [row['numero_aula'] for row in results] if results else []
+        # Linhas ou bitmap, conforme o layout do curso (ver aulas_storage.py)
+        if formato == 'ranges':
+            return aulas_store.listar_intervalos(connection, curso_id)
+        return aulas_store.listar(connection, curso_id)
     except Exception as e:
         logger.error(f"Erro ao buscar lista de aulas concluídas para curso {curso_id}: {str(e)}")
         raise Exception(f"Erro ao consultar lista de aulas")
 
+# Formatos de aulas_concluidas_list: números (padrão) ou intervalos [inicio, fim]
+FORMATOS_LISTA = ('list', 'ranges')
+MIME_INTERVALOS = 'application/vnd.webcursos.ranges+json'
+MODOS_STREAM = ('json', 'ndjson')
+MIME_NDJSON = 'application/x-ndjson'
+
+def aceita_intervalos():
+    """
+    Indica se o cliente pediu intervalos pelo cabeçalho Accept.
+    """
+    return any(mimetype == MIME_INTERVALOS for mimetype, _ in request.accept_mimetypes)
+
+def parse_formato_lista():
+    """
+    Formato de aulas_concluidas_list: parâmetro list_format ou, na falta dele,
+    o cabeçalho Accept. Lança ValueError para formatos desconhecidos.
+    """
+    formato = request.args.get('list_format')
+    if formato is None:
+        return 'ranges' if aceita_intervalos() else 'list'
+    if formato not in FORMATOS_LISTA:
+        raise ValueError(f"list_format deve ser um de: {', '.join(FORMATOS_LISTA)}")
+    return formato
+
+def aceita_ndjson():
+    """
+    Indica se o cliente pediu NDJSON pelo cabeçalho Accept.
+    """
+    return any(mimetype == MIME_NDJSON for mimetype, _ in request.accept_mimetypes)
+
+def parse_modo_stream():
+    """
+    Modo de streaming da listagem: parâmetro stream ou, na falta dele, o cabeçalho
+    Accept (application/x-ndjson). Retorna None para a resposta comum.
+    """
+    modo = request.args.get('stream')
+    if modo is None:
+        return 'ndjson' if aceita_ndjson() else None
+    if modo not in MODOS_STREAM:
+        raise ValueError(f"stream deve ser um de: {', '.join(MODOS_STREAM)}")
+    return modo
+
+def variante_requisicao():
+    """
+    Identifica a representação pedida: URL completa mais o que for negociado por cabeçalho.
+    Usada no ETag e na chave do cache de respostas.
+    """
+    variante = request.full_path
+    if 'list_format' not in request.args and aceita_intervalos():
+        variante += '#ranges'
+    if 'stream' not in request.args and aceita_ndjson():
+        variante += '#ndjson'
+    return variante
+
+def validar_lista_aulas(aulas):
+    """
+    Valida uma lista de objetos {numero_aula, concluida}.
+    Retorna a mensagem de erro ou None se a lista for válida.
+    """
+    for aula in aulas:
+        if not isinstance(aula, dict) or 'numero_aula' not in aula or 'concluida' not in aula:
+            return 'Cada item em aulas deve ter numero_aula e concluida'
+        
+        if not isinstance(aula['numero_aula'], int) or aula['numero_aula'] <= 0:
+            return 'numero_aula deve ser um número inteiro positivo'
+        
+        if not isinstance(aula['concluida'], bool):
+            return 'concluida deve ser true ou false'
+    return None
+
+def parse_bool_arg(valor):
+    """
+    Interpreta parâmetros booleanos de query string (true/1/sim).
+    """
+    return (valor or '').strip().lower() in ('1', 'true', 'sim', 'yes')
+
+def calcular_progresso(aulas_concluidas, total_aulas):
+    """
+    Calcula o progresso percentual de um curso.
+    """
+    if total_aulas and total_aulas > 0:
+        return round((aulas_concluidas / total_aulas) * 100, 1)
+    return 0.0
+
 def calcular_estimativas_tempo(curso):
     """
     Calcula estimativas de tempo baseadas na carga horária do curso.
@@ -192,43 +333,389 @@ def calcular_estimativas_tempo(curso):
         curso['tempo_restante_formatado'] = '0min'
         return curso
 
+def conditional_get(view):
+    """
+    Decorator de GET condicional: gera um ETag forte a partir da versão dos dados
+    e responde 304 a If-None-Match sem consultar as tabelas de cursos.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with db_manager.connection() as conn:
+            version = db_manager.get_data_version(conn)
+        g.data_version = version
+        
+        # A versão é lida antes da consulta: se houver escrita concorrente,
+        # o ETag fica mais antigo que o corpo e a próxima requisição revalida.
+        variante = hashlib.sha1(variante_requisicao().encode('utf-8')).hexdigest()[:16]
+        etag = f"v{version}-{variante}"
+        
+        # O cliente pode guardar o ETag de qualquer codificação (gzip, br)
+        recebido = next((candidato for candidato in etag_variants(etag) if request.if_none_match.contains(candidato)), None)
+        if recebido:
+            response = app.response_class(status=304)
+            etag = recebido
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+        return response
+    return wrapper
+
+def cached_response(*tag_templates):
+    """
+    Decorator que guarda em memória o corpo serializado de respostas 200.
+    As tags (ex.: 'curso:{curso_id}') são invalidadas por registrar_escrita e,
+    para escritas de outros processos, por cache_coherence.sync().
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = g.get('data_version')
+            if version is None:
+                with db_manager.connection() as conn:
+                    version = db_manager.get_data_version(conn)
+            
+            # Sincronizar só depois de ler a versão: as escritas de outros processos até
+            # ela já foram aplicadas ao cache, e um acerto nunca é mais antigo que o ETag
+            cache_coherence.sync()
+            
+            key = variante_requisicao()
+            body = response_cache.get(key)
+            if body is not None:
+                return app.response_class(body, status=200, mimetype='application/json')
+            
+            response = make_response(view(*args, **kwargs))
+            # Respostas em streaming não são guardadas: ler o corpo anularia o streaming
+            if response.status_code == 200 and not response.is_streamed:
+                tags = [tag.format(**kwargs) for tag in tag_templates]
+                response_cache.set(key, response.get_data(), tags, version)
+            return response
+        return wrapper
+    return decorator
+
+def registrar_escrita(connection, mudancas):
+    """
+    Chamada pela fila de escrita antes de cada commit, com as mudanças
+    (Mudanca) do grupo: incrementa a versão dos dados, invalida as respostas
+    em cache afetadas e grava os eventos no diário de mudanças. Invalidar antes do commit
+    garante que nenhuma leitura anterior à escrita seja guardada depois dela.
+    """
+    version = db_manager.bump_data_version(connection)
+    tags = ['cursos', 'stats']
+    tags.extend(dict.fromkeys(f'curso:{mudanca.curso_id}' for mudanca in mudancas))
+    response_cache.invalidate(tags, version)
+    cache_coherence.record(connection, tags, version)
+    event_feed.record(connection, version, mudancas)
+    return version
+
+# Fila de escrita: toda escrita passa por ela (controle de admissão), e escritas
+# concorrentes compartilham uma transação (group commit)
+write_queue = WriteQueue(
+    db_manager.new_connection,
+    before_commit=registrar_escrita,
+    direct_connection_factory=db_manager.get_connection
+)
+
+class ErroRequisicao(Exception):
+    """
+    Erro de validação detectado dentro de uma operação da fila de escrita.
+    """
+    def __init__(self, message, status_code=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+# Campos de curso vindos diretamente do banco -> expressão SQL
+CAMPOS_SQL_CURSO = {
+    'id': 'id',
+    'titulo': 'titulo',
+    'link': 'link',
+    'total_aulas': 'total_aulas',
+    'anotacoes': 'anotacoes',
+    'horas': 'horas',
+    'minutos': 'minutos',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'aulas_concluidas': 'aulas_concluidas_count AS aulas_concluidas'
+}
+
+# Campos adicionados por calcular_estimativas_tempo
+CAMPOS_ESTIMATIVA = (
+    'duracao_total', 'duracao_por_aula', 'tempo_restante',
+    'duracao_total_formatada', 'duracao_por_aula_formatada', 'tempo_restante_formatado'
+)
+
+# Campos calculados -> colunas necessárias para calculá-los
+DEPENDENCIAS_CAMPOS = {
+    'progresso': ('aulas_concluidas', 'total_aulas'),
+    **{campo: ('horas', 'minutos', 'total_aulas', 'aulas_concluidas') for campo in CAMPOS_ESTIMATIVA}
+}
+
+def parse_campos(args, extras=()):
+    """
+    Lê o parâmetro fields= (lista separada por vírgulas).
+    Retorna None quando todos os campos devem ser retornados.
+    """
+    fields = args.get('fields')
+    if not fields:
+        return None
+    
+    permitidos = set(CAMPOS_SQL_CURSO) | set(DEPENDENCIAS_CAMPOS) | set(extras)
+    campos = {campo.strip() for campo in fields.split(',') if campo.strip()}
+    invalidos = sorted(campos - permitidos)
+    if invalidos:
+        raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+    
+    # O id é sempre retornado
+    campos.add('id')
+    return campos
+
+def colunas_select_curso(campos):
+    """
+    Monta a lista de colunas do SELECT com apenas o necessário para os campos pedidos.
+    """
+    if campos is None:
+        return ', '.join(CAMPOS_SQL_CURSO.values())
+    
+    necessarios = {campo for campo in campos if campo in CAMPOS_SQL_CURSO}
+    for campo in campos:
+        necessarios.update(DEPENDENCIAS_CAMPOS.get(campo, ()))
+    return ', '.join(expr for campo, expr in CAMPOS_SQL_CURSO.items() if campo in necessarios)
+
+def montar_curso(curso, campos):
+    """
+    Adiciona os campos calculados pedidos e remove as colunas usadas só como dependência.
+    """
+    if campos is None or 'progresso' in campos:
+        curso['progresso'] = calcular_progresso(curso['aulas_concluidas'], curso['total_aulas'])
+    
+    if campos is None:
+        return calcular_estimativas_tempo(curso)
+    
+    if not campos.isdisjoint(CAMPOS_ESTIMATIVA):
+        curso = calcular_estimativas_tempo(curso)
+    
+    return {campo: valor for campo, valor in curso.items() if campo in campos}
+
+# Chaves de ordenação da listagem -> coluna indexada (ver init_db.py)
+ORDENACOES_CURSOS = {
+    'created_at': {'coluna': 'created_at', 'order': 'desc'},
+    'updated_at': {'coluna': 'updated_at', 'order': 'desc'},
+    'titulo': {'coluna': 'titulo', 'collate': ' COLLATE NOCASE', 'order': 'asc'},
+    'progresso': {'coluna': 'progresso_ordem', 'order': 'desc'},
+    'tempo_restante': {'coluna': 'tempo_restante_minutos', 'order': 'asc'}
+}
+STATUS_CURSOS = ('concluido', 'em_andamento', 'nao_iniciado')
+MAX_LIMIT_LISTAGEM = 500
+MAX_CURSOS_LOTE = 500  # Mantém o IN (...) abaixo do limite de parâmetros do SQLite
+MAX_TOTAL_AULAS = 10000  # Por curso
+MAX_AULAS_INTERVALO = 10000  # Aulas de uma requisição (intervalos ou lote entre cursos): a fila de escrita tem uma única thread
+
+def encode_cursor(sort, order, valor, curso_id):
+    """
+    Gera o cursor opaco (keyset) a partir do último curso da página.
+    """
+    payload = json.dumps([sort, order, valor, curso_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, sort, order):
+    """
+    Decodifica o cursor e valida que ele pertence à mesma ordenação.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        cursor_sort, cursor_order, valor, curso_id = payload
+    except Exception:
+        raise ValueError("Cursor inválido")
+    
+    if cursor_sort != sort or cursor_order != order or not isinstance(curso_id, int):
+        raise ValueError("Cursor não corresponde à ordenação solicitada")
+    return valor, curso_id
+
+def parse_parametros_listagem(args):
+    """
+    Valida os parâmetros de paginação, ordenação e filtro da listagem de cursos.
+    """
+    sort = args.get('sort', 'created_at')
+    if sort not in ORDENACOES_CURSOS:
+        raise ValueError(f"Ordenação inválida. Use: {', '.join(ORDENACOES_CURSOS)}")
+    
+    order = args.get('order', ORDENACOES_CURSOS[sort]['order']).lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("order deve ser 'asc' ou 'desc'")
+    
+    status = args.get('status')
+    if status and status not in STATUS_CURSOS:
+        raise ValueError(f"Status inválido. Use: {', '.join(STATUS_CURSOS)}")
+    
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit deve ser um número inteiro")
+        if limit <= 0 or limit > MAX_LIMIT_LISTAGEM:
+            raise ValueError(f"limit deve estar entre 1 e {MAX_LIMIT_LISTAGEM}")
+    
+    after = args.get('after')
+    if after:
+        after = decode_cursor(after, sort, order)
+    
+    return {
+        'sort': sort,
+        'order': order,
+        'status': status,
+        'limit': limit,
+        'after': after
+    }
+
+def consulta_listagem_cursos(listagem, campos):
+    """
+    Monta a consulta da listagem de cursos (filtro, cursor keyset e ordenação).
+    Retorna (query, params); a coluna sort_key alimenta o next_cursor.
+    """
+    ordenacao = ORDENACOES_CURSOS[listagem['sort']]
+    coluna = ordenacao['coluna']
+    collate = ordenacao.get('collate', '')
+    direcao = listagem['order'].upper()
+    
+    where = []
+    params = []
+    if listagem['status']:
+        where.append("status = ?")
+        params.append(listagem['status'])
+    if listagem['after']:
+        operador = '<' if direcao == 'DESC' else '>'
+        where.append(f"({coluna}, id) {operador} (?{collate}, ?)")
+        params.extend(listagem['after'])
+    
+    # Buscar os cursos já com a contagem de aulas concluídas (uma única consulta)
+    query = f"""
+        SELECT {colunas_select_curso(campos)}, {coluna} AS sort_key
+        FROM cursos
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {coluna}{collate} {direcao}, id {direcao}
+    """
+    if listagem['limit']:
+        # Um registro extra indica se existe próxima página
+        query += " LIMIT ?"
+        params.append(listagem['limit'] + 1)
+    return query, tuple(params)
+
+def stream_cursos(query, params, listagem, campos, modo):
+    """
+    Escreve a listagem de cursos à medida que os blocos saem do cursor, sem montar
+    a lista inteira em memória. modo 'json' produz o mesmo documento da resposta
+    comum; 'ndjson' uma linha por curso seguida de uma linha com count, has_more
+    e next_cursor. O ritmo é o do cliente, então o stream usa uma conexão própria,
+    fora do pool (como o /events), aberta quando começa e fechada quando termina
+    ou é fechado. Não usa o contexto da requisição: o asgi.py lê cada bloco em uma
+    thread do executor.
+    """
+    limite = listagem['limit']
+    count = 0
+    has_more = False
+    ultimo = None
+    try:
+        if modo == 'json':
+            yield '{"success":true,"timestamp":' + app.json.dumps(datetime.now().isoformat()) + ',"data":{"cursos":['
+        
+        conn = db_manager.new_connection()
+        try:
+            for bloco in db_manager.iter_query(conn, query, params):
+                if limite and count + len(bloco) > limite:
+                    has_more = True
+                    bloco = bloco[:limite - count]
+                
+                linhas = []
+                for curso in bloco:
+                    ultimo = (curso.pop('sort_key'), curso['id'])
+                    linhas.append(app.json.dumps(montar_curso(curso, campos)))
+                if linhas:
+                    if modo == 'json':
+                        yield (',' if count else '') + ','.join(linhas)
+                    else:
+                        yield '\n'.join(linhas) + '\n'
+                count += len(bloco)
+                if has_more:
+                    break
+        finally:
+            conn.close()
+    except Exception as e:
+        # O status 200 já foi enviado: o JSON fica incompleto e o NDJSON termina com o erro
+        logger.error(f"Erro ao transmitir cursos: {str(e)}")
+        if modo == 'ndjson':
+            yield app.json.dumps({'success': False, 'error': 'Falha na consulta dos cursos'}) + '\n'
+        return
+    
+    next_cursor = encode_cursor(listagem['sort'], listagem['order'], *ultimo) if has_more else None
+    resumo = app.json.dumps({'count': count, 'has_more': has_more, 'next_cursor': next_cursor})
+    logger.info(f"Retornados {count} cursos (stream {modo})")
+    if modo == 'json':
+        yield '],' + resumo[1:] + '}'
+    else:
+        yield resumo + '\n'
+
 # ===============================
 # ENDPOINTS DA API RESTful
 # ===============================
 
 @app.route('/api/cursos', methods=['GET'])
+@conditional_get
+@cached_response('cursos')
 def get_cursos():
     """
-    GET /api/cursos - Retorna lista de todos os cursos com número de aulas concluídas.
+    GET /api/cursos - Retorna lista de cursos com número de aulas concluídas.
+    Parâmetros opcionais: limit, after (cursor), sort, order, status, fields,
+    stream (json|ndjson: resposta escrita em blocos, para exportações grandes)
     """
     conn = None
     try:
         logger.info("Buscando lista de cursos")
+        
+        try:
+            listagem = parse_parametros_listagem(request.args)
+            campos = parse_campos(request.args)
+            modo_stream = parse_modo_stream()
+        except ValueError as e:
+            return create_error_response(str(e), 400)
+        
+        query, params = consulta_listagem_cursos(listagem, campos)
+        
+        if modo_stream:
+            corpo = stream_cursos(query, params, listagem, campos, modo_stream)
+            mimetype = MIME_NDJSON if modo_stream == 'ndjson' else 'application/json'
+            return Response(corpo, mimetype=mimetype)
+        
         conn = get_db_connection()
+        cursos_data = db_manager.execute_query(conn, query, params, fetch_all=True)
         
-        # Buscar todos os cursos
-        query = "SELECT id, titulo, link, total_aulas, anotacoes, horas, minutos, created_at, updated_at FROM cursos ORDER BY created_at DESC"
-        cursos_data = db_manager.execute_query(conn, query, fetch_all=True)
+        has_more = bool(listagem['limit']) and len(cursos_data) > listagem['limit']
+        if has_more:
+            cursos_data = cursos_data[:listagem['limit']]
+        
+        next_cursor = None
+        if has_more:
+            ultimo = cursos_data[-1]
+            next_cursor = encode_cursor(listagem['sort'], listagem['order'], ultimo['sort_key'], ultimo['id'])
         
         cursos = []
         for curso in cursos_data:
-            # Calcular aulas concluídas para cada curso
-            curso['aulas_concluidas'] = get_curso_aulas_concluidas(conn, curso['id'])
-            # Calcular progresso em percentual
-            if curso['total_aulas'] > 0:
-                curso['progresso'] = round((curso['aulas_concluidas'] / curso['total_aulas']) * 100, 1)
-            else:
-                curso['progresso'] = 0.0
-            
-            # Calcular estimativas de tempo
-            curso = calcular_estimativas_tempo(curso)
-            
-            cursos.append(curso)
+            del curso['sort_key']
+            # Calcular progresso e estimativas de tempo em uma única passagem
+            cursos.append(montar_curso(curso, campos))
         
         logger.info(f"Retornando {len(cursos)} cursos")
         return create_success_response({
             'cursos': cursos,
-            'count': len(cursos)
+            'count': len(cursos),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -251,7 +738,6 @@ def create_curso():
     POST /api/cursos - Cria um novo curso.
     Recebe: titulo, link (opcional), total_aulas, anotacoes (opcional)
     """
-    conn = None
     try:
         data = request.get_json()
         logger.info(f"Tentativa de criar novo curso: {data.get('titulo') if data else 'dados inválidos'}")
@@ -285,6 +771,13 @@ def create_curso():
                 f"Valor recebido: {data['total_aulas']}"
             )
         
+        if data['total_aulas'] > MAX_TOTAL_AULAS:
+            return create_error_response(
+                f"Total de aulas não pode ser maior que {MAX_TOTAL_AULAS}",
+                400,
+                f"Valor recebido: {data['total_aulas']}"
+            )
+        
         # Validar horas e minutos (opcionais)
         horas = data.get('horas', 0)
         minutos = data.get('minutos', 0)
@@ -303,36 +796,37 @@ def create_curso():
                 f"Valor recebido: {minutos}"
             )
         
-        conn = get_db_connection()
-        
-        # Inserir novo curso - simplified for SQLite
-        insert_query = "INSERT INTO cursos (titulo, link, total_aulas, anotacoes, horas, minutos) VALUES (?, ?, ?, ?, ?, ?)"
-        
-        curso_id = db_manager.execute_query(
-            conn,
-            insert_query,
-            (
-                data['titulo'].strip(),
-                data.get('link', '').strip(),
-                data['total_aulas'],
-                data.get('anotacoes', '').strip(),
-                horas or 0,
-                minutos or 0
+        def operacao(conn):
+            # Inserir novo curso - simplified for SQLite
+            insert_query = "INSERT INTO cursos (titulo, link, total_aulas, anotacoes, horas, minutos) VALUES (?, ?, ?, ?, ?, ?)"
+            
+            curso_id = db_manager.execute_query(
+                conn,
+                insert_query,
+                (
+                    data['titulo'].strip(),
+                    data.get('link', '').strip(),
+                    data['total_aulas'],
+                    data.get('anotacoes', '').strip(),
+                    horas or 0,
+                    minutos or 0
+                )
             )
-        )
-        
-        # Commit the transaction
-        conn.commit()
-        
-        # Buscar o curso recém-criado para retornar
-        select_query = "SELECT id, titulo, link, total_aulas, anotacoes, horas, minutos, created_at, updated_at FROM cursos WHERE id = ?"
-        
-        curso_row = db_manager.execute_query(conn, select_query, (curso_id,), fetch_one=True)
-        
-        if not curso_row:
-            raise Exception("Falha ao recuperar o curso criado")
             
-        novo_curso = curso_row
+            aulas_store.iniciar_curso(conn, curso_id)
+            
+            # Buscar o curso recém-criado para retornar
+            select_query = "SELECT id, titulo, link, total_aulas, anotacoes, horas, minutos, created_at, updated_at FROM cursos WHERE id = ?"
+            
+            curso_row = db_manager.execute_query(conn, select_query, (curso_id,), fetch_one=True)
+            
+            if not curso_row:
+                raise Exception("Falha ao recuperar o curso criado")
+            return curso_row, [Mudanca(curso_id, CURSO_CRIADO)]
+        
+        # Commit feito pela fila de escrita
+        novo_curso = write_queue.submit(operacao)
+        curso_id = novo_curso['id']
         novo_curso['aulas_concluidas'] = 0
         novo_curso['progresso'] = 0.0
         
@@ -347,6 +841,8 @@ def create_curso():
             201
         )
         
+    except WriteRejected as e:
+        return create_overload_response(e)
     except Exception as e:
         logger.error(f"Erro ao criar curso: {str(e)}")
         return create_error_response(
@@ -354,23 +850,26 @@ def create_curso():
             500,
             str(e)
         )
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception as close_error:
-                logger.error(f"Erro ao fechar conexão: {str(close_error)}")
 
 @app.route('/api/cursos/<int:curso_id>', methods=['GET'])
+@conditional_get
+@cached_response('curso:{curso_id}')
 def get_curso(curso_id):
     """
     GET /api/cursos/<id> - Retorna detalhes de um curso específico com suas aulas concluídas.
+    Parâmetro opcional: fields
     """
     try:
+        try:
+            campos = parse_campos(request.args, extras=('aulas_concluidas_list',))
+            formato = parse_formato_lista()
+        except ValueError as e:
+            return create_error_response(str(e), 400)
+        
         conn = get_db_connection()
         
         # Buscar o curso
-        query = "SELECT id, titulo, link, total_aulas, anotacoes, horas, minutos, created_at, updated_at FROM cursos WHERE id = ?"
+        query = f"SELECT {colunas_select_curso(campos)} FROM cursos WHERE id = ?"
         curso_row = db_manager.execute_query(conn, query, (curso_id,), fetch_one=True)
         
         if not curso_row:
@@ -378,17 +877,11 @@ def get_curso(curso_id):
             return create_error_response("Curso não encontrado", 404)
         
         curso = curso_row
-        curso['aulas_concluidas'] = get_curso_aulas_concluidas(conn, curso_id)
-        curso['aulas_concluidas_list'] = get_aulas_concluidas_list(conn, curso_id)
+        if campos is None or 'aulas_concluidas_list' in campos:
+            curso['aulas_concluidas_list'] = get_aulas_concluidas_list(conn, curso_id, formato)
         
-        # Calcular progresso
-        if curso['total_aulas'] > 0:
-            curso['progresso'] = round((curso['aulas_concluidas'] / curso['total_aulas']) * 100, 1)
-        else:
-            curso['progresso'] = 0.0
-            
-        # Calcular estimativas de tempo
-        curso = calcular_estimativas_tempo(curso)
+        # Calcular progresso e estimativas de tempo
+        curso = montar_curso(curso, campos)
         
         conn.close()
         return create_success_response(curso)
@@ -416,18 +909,6 @@ def update_curso(curso_id):
                 'error': 'Nenhum dado fornecido'
             }), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se o curso existe
-        cursor.execute('SELECT id FROM cursos WHERE id = ?', (curso_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify({
-                'success': False,
-                'error': 'Curso não encontrado'
-            }), 404
-        
         # Construir query de update dinamicamente
         update_fields = []
         update_values = []
@@ -446,6 +927,11 @@ def update_curso(curso_id):
                     'success': False,
                     'error': 'total_aulas deve ser um número inteiro não negativo'
                 }), 400
+            if data['total_aulas'] > MAX_TOTAL_AULAS:
+                return jsonify({
+                    'success': False,
+                    'error': f'total_aulas não pode ser maior que {MAX_TOTAL_AULAS}'
+                }), 400
             update_fields.append('total_aulas = ?')
             update_values.append(data['total_aulas'])
         
@@ -481,36 +967,46 @@ def update_curso(curso_id):
         update_fields.append('updated_at = ?')
         update_values.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         
+        try:
+            formato = parse_formato_lista()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Executar update
         update_values.append(curso_id)  # Para a cláusula WHERE
         query = f"UPDATE cursos SET {', '.join(update_fields)} WHERE id = ?"
         
-        cursor.execute(query, update_values)
-        conn.commit()
-        cursor.close()  # Close the cursor after use
-        
-        # Buscar e retornar o curso atualizado
-        cursor = conn.cursor()  # Create a new cursor for the next query
-        cursor.execute('''
-            SELECT id, titulo, link, total_aulas, anotacoes, horas, minutos, created_at, updated_at
-            FROM cursos 
-            WHERE id = ?
-        ''', (curso_id,))
-        
-        curso_atualizado = dict(cursor.fetchone())
-        curso_atualizado['aulas_concluidas'] = get_curso_aulas_concluidas(conn, curso_id)
-        curso_atualizado['aulas_concluidas_list'] = get_aulas_concluidas_list(conn, curso_id)
+        def operacao(conn):
+            cursor = conn.cursor()
+            
+            # Verificar se o curso existe
+            cursor.execute('SELECT id FROM cursos WHERE id = ?', (curso_id,))
+            if not cursor.fetchone():
+                raise ErroRequisicao('Curso não encontrado', 404)
+            
+            cursor.execute(query, update_values)
+            
+            # Buscar e retornar o curso atualizado
+            cursor.execute('''
+                SELECT id, titulo, link, total_aulas, anotacoes, horas, minutos, created_at, updated_at,
+                       aulas_concluidas_count AS aulas_concluidas
+                FROM cursos 
+                WHERE id = ?
+            ''', (curso_id,))
+            
+            curso = dict(cursor.fetchone())
+            cursor.close()
+            curso['aulas_concluidas_list'] = get_aulas_concluidas_list(conn, curso_id, formato)
+            return curso, [Mudanca(curso_id, CURSO_ATUALIZADO)]
         
-        if curso_atualizado['total_aulas'] > 0:
-            curso_atualizado['progresso'] = round((curso_atualizado['aulas_concluidas'] / curso_atualizado['total_aulas']) * 100, 1)
-        else:
-            curso_atualizado['progresso'] = 0.0
+        curso_atualizado = write_queue.submit(operacao)
+        curso_atualizado['progresso'] = calcular_progresso(curso_atualizado['aulas_concluidas'], curso_atualizado['total_aulas'])
             
         # Calcular estimativas de tempo
         curso_atualizado = calcular_estimativas_tempo(curso_atualizado)
-            
-        cursor.close()
-        conn.close()
         
         return jsonify({
             'success': True,
@@ -518,6 +1014,13 @@ def update_curso(curso_id):
             'message': 'Curso atualizado com sucesso'
         }), 200
         
+    except WriteRejected as e:
+        return create_overload_response(e)
+    except ErroRequisicao as e:
+        return jsonify({
+            'success': False,
+            'error': e.message
+        }), e.status_code
     except Exception as e:
         return jsonify({
             'success': False,
@@ -530,33 +1033,33 @@ def delete_curso(curso_id):
     DELETE /api/cursos/<id> - Deleta um curso e suas aulas associadas.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se o curso existe
-        cursor.execute('SELECT titulo FROM cursos WHERE id = ?', (curso_id,))
-        curso = cursor.fetchone()
-        if not curso:
-            conn.close()
-            return jsonify({
-                'success': False,
-                'error': 'Curso não encontrado'
-            }), 404
-        
-        # Deletar aulas concluídas associadas (CASCADE)
-        cursor.execute('DELETE FROM aulas_concluidas WHERE curso_id = ?', (curso_id,))
+        def operacao(conn):
+            # Verificar se o curso existe
+            curso = conn.execute('SELECT titulo FROM cursos WHERE id = ?', (curso_id,)).fetchone()
+            if not curso:
+                raise ErroRequisicao('Curso não encontrado', 404)
+            
+            # Deletar aulas concluídas associadas (linhas ou bitmap)
+            aulas_store.remover_curso(conn, curso_id)
+            
+            # Deletar o curso
+            conn.execute('DELETE FROM cursos WHERE id = ?', (curso_id,))
+            return curso['titulo'], [Mudanca(curso_id, CURSO_REMOVIDO)]
         
-        # Deletar o curso
-        cursor.execute('DELETE FROM cursos WHERE id = ?', (curso_id,))
-        
-        conn.commit()
-        conn.close()
+        titulo = write_queue.submit(operacao)
         
         return jsonify({
             'success': True,
-            'message': f'Curso "{curso["titulo"]}" deletado com sucesso'
+            'message': f'Curso "{titulo}" deletado com sucesso'
         }), 200
         
+    except WriteRejected as e:
+        return create_overload_response(e)
+    except ErroRequisicao as e:
+        return jsonify({
+            'success': False,
+            'error': e.message
+        }), e.status_code
     except Exception as e:
         return jsonify({
             'success': False,
@@ -568,6 +1071,8 @@ def toggle_aula_concluida(curso_id):
     """
     POST /api/cursos/<id>/aula - Adiciona ou remove aula da lista de concluídas.
     Recebe: numero_aula, concluida (true/false)
+    Parâmetros opcionais: include_list=true (inclui aulas_concluidas_list na resposta),
+    list_format=list|ranges
     """
     try:
         data = request.get_json()
@@ -593,68 +1098,64 @@ def toggle_aula_concluida(curso_id):
                 'error': 'concluida deve ser true ou false'
             }), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se o curso existe e obter total de aulas
-        cursor.execute('SELECT titulo, total_aulas FROM cursos WHERE id = ?', (curso_id,))
-        curso = cursor.fetchone()
-        if not curso:
-            conn.close()
-            return jsonify({
-                'success': False,
-                'error': 'Curso não encontrado'
-            }), 404
-        
-        # Verificar se o número da aula é válido
-        if numero_aula > curso['total_aulas']:
-            conn.close()
+        incluir_lista = parse_bool_arg(request.args.get('include_list'))
+        try:
+            formato = parse_formato_lista()
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': f'Número da aula ({numero_aula}) não pode ser maior que o total de aulas ({curso["total_aulas"]})'
+                'error': str(e)
             }), 400
         
+        def operacao(conn):
+            # Escrita condicionada + leitura do estado: existência, limite e nova contagem
+            # em dois comandos (sem efeito se a aula já estiver no estado pedido)
+            estado = aulas_store.alternar(conn, curso_id, numero_aula, concluida)
+            if estado is None:
+                raise ErroRequisicao('Curso não encontrado', 404)
+            
+            # Verificar se o número da aula é válido
+            if numero_aula > estado['total_aulas']:
+                raise ErroRequisicao(
+                    f'Número da aula ({numero_aula}) não pode ser maior que o total de aulas ({estado["total_aulas"]})'
+                )
+            
+            dados = {
+                'curso_id': curso_id,
+                'numero_aula': numero_aula,
+                'concluida': concluida,
+                'total_aulas_concluidas': estado['total_concluidas'],
+                'progresso': calcular_progresso(estado['total_concluidas'], estado['total_aulas'])
+            }
+            if incluir_lista:
+                dados['aulas_concluidas_list'] = get_aulas_concluidas_list(conn, curso_id, formato)
+            if not estado['alterada']:
+                return dados, []
+            aula = ((numero_aula, numero_aula),)
+            if concluida:
+                return dados, [Mudanca(curso_id, AULAS_ATUALIZADAS, marcadas=aula)]
+            return dados, [Mudanca(curso_id, AULAS_ATUALIZADAS, desmarcadas=aula)]
+        
+        dados = write_queue.submit(operacao)
+        
         if concluida:
-            # Marcar aula como concluída (inserir se não existir)
-            cursor.execute('''
-                INSERT OR IGNORE INTO aulas_concluidas (curso_id, numero_aula)
-                VALUES (?, ?)
-            ''', (curso_id, numero_aula))
             message = f'Aula {numero_aula} marcada como concluída'
         else:
-            # Desmarcar aula como concluída (remover se existir)
-            cursor.execute('''
-                DELETE FROM aulas_concluidas
-                WHERE curso_id = ? AND numero_aula = ?
-            ''', (curso_id, numero_aula))
             message = f'Aula {numero_aula} desmarcada como concluída'
         
-        conn.commit()
-        cursor.close()  # Close the cursor after use
-        
-        # Retornar status atualizado do curso
-        total_concluidas = get_curso_aulas_concluidas(conn, curso_id)
-        aulas_concluidas_list = get_aulas_concluidas_list(conn, curso_id)
-        
-        progresso = 0.0
-        if curso['total_aulas'] > 0:
-            progresso = round((total_concluidas / curso['total_aulas']) * 100, 1)
-        
-        conn.close()
-        
         return jsonify({
             'success': True,
-            'data': {
-                'curso_id': curso_id,
-                'numero_aula': numero_aula,
-                'concluida': concluida,
-                'total_aulas_concluidas': total_concluidas,
-                'aulas_concluidas_list': aulas_concluidas_list,
-                'progresso': progresso
-            },
+            'data': dados,
             'message': message
         }), 200
         
+    except WriteRejected as e:
+        return create_overload_response(e)
+    except ErroRequisicao as e:
+        return jsonify({
+            'success': False,
+            'error': e.message
+        }), e.status_code
     except Exception as e:
         return jsonify({
             'success': False,
@@ -666,6 +1167,8 @@ def batch_toggle_aulas_concluidas(curso_id):
     """
     POST /api/cursos/<id>/aulas/batch - Marca ou desmarca múltiplas aulas como concluídas em lote.
     Recebe: aulas (array de objetos com numero_aula e concluida)
+    Parâmetros opcionais: delta=true (retorna só as aulas que mudaram de estado),
+    list_format=list|ranges
     """
     try:
         data = request.get_json()
@@ -683,68 +1186,24 @@ def batch_toggle_aulas_concluidas(curso_id):
             )
         
         # Validate each aula object
-        for aula in data['aulas']:
-            if not isinstance(aula, dict) or 'numero_aula' not in aula or 'concluida' not in aula:
-                return create_error_response(
-                    'Cada item em aulas deve ter numero_aula e concluida',
-                    400
-                )
-            
-            numero_aula = aula['numero_aula']
-            concluida = aula['concluida']
-            
-            if not isinstance(numero_aula, int) or numero_aula <= 0:
-                return create_error_response(
-                    'numero_aula deve ser um número inteiro positivo',
-                    400
-                )
-            
-            if not isinstance(concluida, bool):
-                return create_error_response(
-                    'concluida deve ser true ou false',
-                    400
-                )
-        
-        conn = get_db_connection()
-        
-        # Verificar se o curso existe e obter total de aulas
-        query = "SELECT titulo, total_aulas FROM cursos WHERE id = ?"
-        curso = db_manager.execute_query(conn, query, (curso_id,), fetch_one=True)
-        if not curso:
-            conn.close()
-            return create_error_response("Curso não encontrado", 404)
-        
-        # Validate all aula numbers
-        for aula in data['aulas']:
-            numero_aula = aula['numero_aula']
-            if numero_aula > curso['total_aulas']:
-                conn.close()
-                return create_error_response(
-                    f'Número da aula ({numero_aula}) não pode ser maior que o total de aulas ({curso["total_aulas"]})',
-                    400
-                )
+        erro = validar_lista_aulas(data['aulas'])
+        if erro:
+            return create_error_response(erro, 400)
         
         # Process all aulas in a single transaction
-        cursor = conn.cursor()
         updated_aulas = []
+        estado_final = {}
         
         for aula in data['aulas']:
             numero_aula = aula['numero_aula']
             concluida = aula['concluida']
             
+            # Se a mesma aula aparecer mais de uma vez, vale a última ocorrência
+            estado_final[numero_aula] = concluida
+            
             if concluida:
-                # Marcar aula como concluída (inserir se não existir)
-                cursor.execute('''
-                    INSERT OR IGNORE INTO aulas_concluidas (curso_id, numero_aula)
-                    VALUES (?, ?)
-                ''', (curso_id, numero_aula))
                 message = f'Aula {numero_aula} marcada como concluída'
             else:
-                # Desmarcar aula como concluída (remover se existir)
-                cursor.execute('''
-                    DELETE FROM aulas_concluidas
-                    WHERE curso_id = ? AND numero_aula = ?
-                ''', (curso_id, numero_aula))
                 message = f'Aula {numero_aula} desmarcada como concluída'
             
             updated_aulas.append({
@@ -753,34 +1212,499 @@ def batch_toggle_aulas_concluidas(curso_id):
                 'message': message
             })
         
-        conn.commit()
-        cursor.close()
+        delta = parse_bool_arg(request.args.get('delta'))
+        try:
+            formato = parse_formato_lista()
+        except ValueError as e:
+            return create_error_response(str(e), 400)
+        
+        def operacao(conn):
+            # Verificar se o curso existe e obter total de aulas
+            curso = conn.execute('SELECT titulo, total_aulas FROM cursos WHERE id = ?', (curso_id,)).fetchone()
+            if not curso:
+                raise ErroRequisicao("Curso não encontrado", 404)
+            
+            # Validate all aula numbers
+            maior = max(estado_final)
+            if maior > curso['total_aulas']:
+                raise ErroRequisicao(
+                    f'Número da aula ({maior}) não pode ser maior que o total de aulas ({curso["total_aulas"]})'
+                )
+            
+            # Um executemany para inserções e outro para remoções
+            alteracoes = aulas_store.aplicar(
+                conn,
+                curso_id,
+                marcar=[numero for numero, concluida in estado_final.items() if concluida],
+                desmarcar=[numero for numero, concluida in estado_final.items() if not concluida]
+            )
+            
+            # Get updated course status
+            total_concluidas = get_curso_aulas_concluidas(conn, curso_id)
+            progresso = calcular_progresso(total_concluidas, curso['total_aulas'])
+            
+            if delta:
+                # Resposta compacta: apenas as aulas cujo estado mudou
+                dados = {
+                    'curso_id': curso_id,
+                    'marcadas': alteracoes['marcadas'],
+                    'desmarcadas': alteracoes['desmarcadas'],
+                    'total_aulas_concluidas': total_concluidas,
+                    'progresso': progresso
+                }
+            else:
+                dados = {
+                    'curso_id': curso_id,
+                    'updated_aulas': updated_aulas,
+                    'total_aulas_concluidas': total_concluidas,
+                    'aulas_concluidas_list': get_aulas_concluidas_list(conn, curso_id, formato),
+                    'progresso': progresso
+                }
+            
+            # Só invalida caches/versão quando algo realmente mudou
+            if not (alteracoes['marcadas'] or alteracoes['desmarcadas']):
+                return dados, []
+            return dados, [Mudanca(
+                curso_id, AULAS_ATUALIZADAS,
+                marcadas=para_intervalos(alteracoes['marcadas']),
+                desmarcadas=para_intervalos(alteracoes['desmarcadas'])
+            )]
+        
+        return create_success_response(write_queue.submit(operacao), 'Aulas atualizadas com sucesso')
+        
+    except WriteRejected as e:
+        return create_overload_response(e)
+    except ErroRequisicao as e:
+        return create_error_response(e.message, e.status_code, e.details)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar aulas em lote: {str(e)}")
+        return create_error_response(
+            f'Erro ao atualizar aulas: {str(e)}',
+            500
+        )
+
+@app.route('/api/aulas/batch', methods=['POST'])
+def bulk_toggle_aulas_concluidas():
+    """
+    POST /api/aulas/batch - Marca ou desmarca aulas de vários cursos em uma única transação.
+    Recebe: cursos (array de objetos com curso_id e aulas, no formato de /cursos/<id>/aulas/batch)
+    Retorna apenas as alterações efetivas de cada curso.
+    """
+    try:
+        data = request.get_json(silent=True)
         
-        # Get updated course status
-        total_concluidas = get_curso_aulas_concluidas(conn, curso_id)
-        aulas_concluidas_list = get_aulas_concluidas_list(conn, curso_id)
+        if not data or 'cursos' not in data or not isinstance(data['cursos'], list):
+            return create_error_response(
+                'Campo obrigatório: cursos (array de objetos com curso_id e aulas)',
+                400
+            )
         
-        progresso = 0.0
-        if curso['total_aulas'] > 0:
-            progresso = round((total_concluidas / curso['total_aulas']) * 100, 1)
+        if len(data['cursos']) == 0:
+            return create_error_response('Array de cursos não pode estar vazio', 400)
         
-        conn.close()
+        # Consolidar por curso (se uma aula aparecer mais de uma vez, vale a última ocorrência)
+        estados = {}
+        for item in data['cursos']:
+            if not isinstance(item, dict) or not isinstance(item.get('curso_id'), int) or not isinstance(item.get('aulas'), list):
+                return create_error_response(
+                    'Cada item em cursos deve ter curso_id (inteiro) e aulas (array)',
+                    400
+                )
+            
+            erro = validar_lista_aulas(item['aulas'])
+            if erro:
+                return create_error_response(erro, 400, f"curso_id: {item['curso_id']}")
+            
+            estado_final = estados.setdefault(item['curso_id'], {})
+            for aula in item['aulas']:
+                estado_final[aula['numero_aula']] = aula['concluida']
         
-        return create_success_response({
-            'curso_id': curso_id,
-            'updated_aulas': updated_aulas,
-            'total_aulas_concluidas': total_concluidas,
-            'aulas_concluidas_list': aulas_concluidas_list,
-            'progresso': progresso
-        }, 'Aulas atualizadas com sucesso')
+        if len(estados) > MAX_CURSOS_LOTE:
+            return create_error_response(
+                f'No máximo {MAX_CURSOS_LOTE} cursos por requisição',
+                400
+            )
+        
+        # Limita o trabalho de uma única escrita (ver MAX_AULAS_INTERVALO)
+        total_lote = sum(len(estado_final) for estado_final in estados.values())
+        if total_lote > MAX_AULAS_INTERVALO:
+            return create_error_response(
+                f'O lote pode ter no máximo {MAX_AULAS_INTERVALO} aulas por requisição',
+                400,
+                f"Aulas no lote: {total_lote}"
+            )
+        
+        def operacao(conn):
+            # Uma única consulta para validar todos os cursos
+            curso_ids = list(estados)
+            placeholders = ', '.join('?' for _ in curso_ids)
+            rows = db_manager.execute_query(
+                conn,
+                f"SELECT id, total_aulas FROM cursos WHERE id IN ({placeholders})",
+                tuple(curso_ids),
+                fetch_all=True
+            )
+            total_aulas = {row['id']: row['total_aulas'] for row in rows}
+            
+            inexistentes = [curso_id for curso_id in curso_ids if curso_id not in total_aulas]
+            if inexistentes:
+                raise ErroRequisicao(
+                    "Curso não encontrado",
+                    404,
+                    f"curso_id: {', '.join(str(curso_id) for curso_id in inexistentes)}"
+                )
+            
+            for curso_id, estado_final in estados.items():
+                maior = max(estado_final, default=0)
+                if maior > total_aulas[curso_id]:
+                    raise ErroRequisicao(
+                        f'Número da aula ({maior}) não pode ser maior que o total de aulas ({total_aulas[curso_id]})',
+                        details=f"curso_id: {curso_id}"
+                    )
+            
+            # Aplicar tudo na mesma transação (um único commit)
+            alteracoes = {}
+            for curso_id, estado_final in estados.items():
+                alteracoes[curso_id] = aulas_store.aplicar(
+                    conn,
+                    curso_id,
+                    marcar=[numero for numero, concluida in estado_final.items() if concluida],
+                    desmarcar=[numero for numero, concluida in estado_final.items() if not concluida]
+                )
+            
+            rows = db_manager.execute_query(
+                conn,
+                f"SELECT id, aulas_concluidas_count FROM cursos WHERE id IN ({placeholders})",
+                tuple(curso_ids),
+                fetch_all=True
+            )
+            contagens = {row['id']: row['aulas_concluidas_count'] for row in rows}
+            
+            cursos = []
+            for curso_id, delta in alteracoes.items():
+                cursos.append({
+                    'curso_id': curso_id,
+                    'marcadas': delta['marcadas'],
+                    'desmarcadas': delta['desmarcadas'],
+                    'total_aulas_concluidas': contagens[curso_id],
+                    'progresso': calcular_progresso(contagens[curso_id], total_aulas[curso_id])
+                })
+            
+            mudancas = [
+                Mudanca(
+                    curso_id, AULAS_ATUALIZADAS,
+                    marcadas=para_intervalos(delta['marcadas']),
+                    desmarcadas=para_intervalos(delta['desmarcadas'])
+                )
+                for curso_id, delta in alteracoes.items()
+                if delta['marcadas'] or delta['desmarcadas']
+            ]
+            return {'cursos': cursos, 'cursos_alterados': len(mudancas)}, mudancas
+        
+        return create_success_response(write_queue.submit(operacao), 'Aulas atualizadas com sucesso')
         
+    except WriteRejected as e:
+        return create_overload_response(e)
+    except ErroRequisicao as e:
+        return create_error_response(e.message, e.status_code, e.details)
     except Exception as e:
-        logger.error(f"Erro ao atualizar aulas em lote: {str(e)}")
+        logger.error(f"Erro ao atualizar aulas de vários cursos: {str(e)}")
         return create_error_response(
             f'Erro ao atualizar aulas: {str(e)}',
             500
         )
 
+@app.route('/api/cursos/<int:curso_id>/aulas/range', methods=['POST'])
+def range_toggle_aulas_concluidas(curso_id):
+    """
+    POST /api/cursos/<id>/aulas/range - Marca ou desmarca intervalos de aulas.
+    Recebe: intervalos (array de objetos com inicio (opcional, padrão 1), fim e concluida)
+    Ex.: [{"fim": 120, "concluida": true}] ou [{"inicio": 40, "fim": 80, "concluida": false}]
+    """
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data or 'intervalos' not in data or not isinstance(data['intervalos'], list):
+            return create_error_response(
+                'Campo obrigatório: intervalos (array de objetos com inicio, fim e concluida)',
+                400
+            )
+        
+        if len(data['intervalos']) == 0:
+            return create_error_response(
+                'Array de intervalos não pode estar vazio',
+                400
+            )
+        
+        intervalos = []
+        for intervalo in data['intervalos']:
+            if not isinstance(intervalo, dict) or 'fim' not in intervalo or 'concluida' not in intervalo:
+                return create_error_response(
+                    'Cada intervalo deve ter fim e concluida (inicio é opcional)',
+                    400
+                )
+            
+            inicio = intervalo.get('inicio', 1)
+            fim = intervalo['fim']
+            concluida = intervalo['concluida']
+            
+            if not isinstance(inicio, int) or not isinstance(fim, int) or inicio <= 0 or fim < inicio:
+                return create_error_response(
+                    'inicio e fim devem ser inteiros positivos com inicio <= fim',
+                    400,
+                    f"Intervalo recebido: {inicio}-{fim}"
+                )
+            
+            if not isinstance(concluida, bool):
+                return create_error_response(
+                    'concluida deve ser true ou false',
+                    400
+                )
+            
+            intervalos.append((inicio, fim, concluida))
+        
+        # Limita o trabalho de uma única escrita (ver MAX_AULAS_INTERVALO)
+        total_intervalos = sum(fim - inicio + 1 for inicio, fim, _ in intervalos)
+        if total_intervalos > MAX_AULAS_INTERVALO:
+            return create_error_response(
+                f'Os intervalos podem cobrir no máximo {MAX_AULAS_INTERVALO} aulas por requisição',
+                400,
+                f"Aulas nos intervalos: {total_intervalos}"
+            )
+        
+        def operacao(conn):
+            # Verificar se o curso existe e obter total de aulas
+            curso = conn.execute('SELECT titulo, total_aulas FROM cursos WHERE id = ?', (curso_id,)).fetchone()
+            if not curso:
+                raise ErroRequisicao("Curso não encontrado", 404)
+            
+            for inicio, fim, concluida in intervalos:
+                if fim > curso['total_aulas']:
+                    raise ErroRequisicao(
+                        f'Número da aula ({fim}) não pode ser maior que o total de aulas ({curso["total_aulas"]})'
+                    )
+            
+            # Todos os intervalos na mesma transação, um comando por intervalo
+            resultados = []
+            for inicio, fim, concluida in intervalos:
+                alteradas = aulas_store.aplicar_intervalo(conn, curso_id, inicio, fim, concluida)
+                resultados.append({
+                    'inicio': inicio,
+                    'fim': fim,
+                    'concluida': concluida,
+                    'alteradas': alteradas
+                })
+            
+            total_concluidas = get_curso_aulas_concluidas(conn, curso_id)
+            dados = {
+                'curso_id': curso_id,
+                'intervalos': resultados,
+                'total_aulas_concluidas': total_concluidas,
+                'progresso': calcular_progresso(total_concluidas, curso['total_aulas'])
+            }
+            # Um registro por intervalo aplicado, na ordem: intervalos posteriores
+            # podem sobrescrever os anteriores
+            mudancas = []
+            for resultado in resultados:
+                if resultado['alteradas']:
+                    intervalo = ((resultado['inicio'], resultado['fim']),)
+                    if resultado['concluida']:
+                        mudancas.append(Mudanca(curso_id, AULAS_ATUALIZADAS, marcadas=intervalo))
+                    else:
+                        mudancas.append(Mudanca(curso_id, AULAS_ATUALIZADAS, desmarcadas=intervalo))
+            return dados, mudancas
+        
+        return create_success_response(write_queue.submit(operacao), 'Intervalos de aulas atualizados com sucesso')
+        
+    except WriteRejected as e:
+        return create_overload_response(e)
+    except ErroRequisicao as e:
+        return create_error_response(e.message, e.status_code, e.details)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar intervalos de aulas: {str(e)}")
+        return create_error_response(
+            f'Erro ao atualizar aulas: {str(e)}',
+            500
+        )
+
+# ===============================
+# ENDPOINTS DE EVENTOS
+# ===============================
+
+# Chaves do environ preenchidas pelo servidor ASGI (asgi.py). Com elas, a espera
+# dos streams e do long polling acontece no loop de eventos, sem ocupar uma thread.
+ASGI_STREAM = 'webcursos.asgi_stream'
+ASGI_ESPERA = 'webcursos.asgi_wait'
+MAX_ESPERA_CHANGES = 60  # Segundos
+RETRY_AFTER_STREAMS = 10  # Segundos
+
+# Cada stream WSGI ocupa uma thread até EVENTS_MAX_DURATION: sem limite, alguns
+# painéis abertos esgotariam as threads do processo e derrubariam a API
+streams_wsgi = threading.BoundedSemaphore(EVENTS_MAX_WSGI_STREAMS)
+
+def aguardar_versao(since, espera):
+    """
+    Long polling no servidor WSGI: bloqueia até existir uma versão mais nova que
+    since ou até esgotar a espera. A conexão do pool é devolvida entre as verificações.
+    """
+    limite = time.monotonic() + espera
+    while True:
+        with db_manager.connection() as conn:
+            if db_manager.get_data_version(conn) > since:
+                return
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            return
+        time.sleep(min(event_feed.poll_interval, restante))
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    GET /api/events - Stream Server-Sent Events com as alterações de cursos e aulas.
+    Cada evento traz curso_id, tipo, aulas_concluidas e version.
+    Retomada: cabeçalho Last-Event-ID (enviado pelo EventSource) ou parâmetro last_event_id.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return create_error_response('Last-Event-ID deve ser um número inteiro', 400)
+    
+    if ASGI_STREAM in request.environ:
+        # O asgi.py envia os eventos a partir do loop de eventos
+        request.environ[ASGI_STREAM] = {'last_event_id': last_event_id}
+        corpo = ()
+        liberar = None
+    else:
+        if not streams_wsgi.acquire(blocking=False):
+            response, status_code = create_error_response(
+                "Muitos streams de eventos abertos, tente novamente em instantes",
+                503,
+                f"Limite de {EVENTS_MAX_WSGI_STREAMS} streams por processo (EVENTS_MAX_WSGI_STREAMS)"
+            )
+            response.headers['Retry-After'] = str(RETRY_AFTER_STREAMS)
+            return response, status_code
+        corpo = stream_with_context(event_feed.stream(last_event_id))
+        liberar = liberar_uma_vez(streams_wsgi.release)
+    
+    response = Response(corpo, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Nginx: não acumular o stream
+    if liberar:
+        # O servidor fecha a resposta ao fim do stream ou quando o cliente desconecta
+        response.call_on_close(liberar)
+    return response
+
+def liberar_uma_vez(liberar):
+    """
+    Envolve liberar para que só a primeira chamada tenha efeito.
+    """
+    lock = threading.Lock()
+    def wrapper():
+        if lock.acquire(blocking=False):
+            liberar()
+    return wrapper
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """
+    GET /api/changes?since=<version> - Sincronização incremental.
+    Retorna os cursos criados/alterados (linha atual), os ids removidos e o delta
+    das aulas concluídas desde a versão informada, mais a versão atual para a
+    próxima chamada. Parâmetros opcionais: fields, list_format e wait (long
+    polling: segundos aguardando uma mudança quando não há nenhuma)
+    """
+    try:
+        try:
+            since = int(request.args['since'])
+        except (KeyError, ValueError):
+            return create_error_response('since deve ser um número inteiro (versão dos dados)', 400)
+        
+        try:
+            campos = parse_campos(request.args)
+            formato = parse_formato_lista()
+        except ValueError as e:
+            return create_error_response(str(e), 400)
+        
+        try:
+            espera = float(request.args.get('wait', 0))
+        except ValueError:
+            espera = -1
+        if not 0 <= espera <= MAX_ESPERA_CHANGES:
+            return create_error_response(f'wait deve estar entre 0 e {MAX_ESPERA_CHANGES} segundos', 400)
+        
+        if espera and ASGI_ESPERA not in request.environ:
+            aguardar_versao(since, espera)
+        elif espera and request.environ[ASGI_ESPERA] is None:
+            with db_manager.connection() as conn:
+                atual = db_manager.get_data_version(conn)
+            if atual <= since:
+                # O asgi.py aguarda no loop de eventos e repete a requisição
+                request.environ[ASGI_ESPERA] = {'since': since, 'timeout': espera}
+                return Response(status=204)
+        
+        with db_manager.connection() as conn:
+            # Uma transação de leitura: diário, versão e linhas do mesmo instante
+            conn.execute('BEGIN')
+            try:
+                version = db_manager.get_data_version(conn)
+                horizonte = event_feed.horizon(conn)
+                if since < horizonte:
+                    # Cursos removidos antes do horizonte já saíram do histórico compactado
+                    return create_error_response(
+                        'Versão anterior ao histórico mantido: recarregue os cursos com GET /api/cursos',
+                        410,
+                        f"since: {since}, mínimo: {horizonte}, version: {version}"
+                    )
+                alteracoes = event_feed.changes_since(conn, since)
+                
+                cursos = {}
+                ids = [curso_id for curso_id, (tipo, _) in alteracoes.items() if tipo != CURSO_REMOVIDO]
+                for inicio in range(0, len(ids), MAX_CURSOS_LOTE):
+                    lote = ids[inicio:inicio + MAX_CURSOS_LOTE]
+                    placeholders = ', '.join('?' for _ in lote)
+                    rows = db_manager.execute_query(
+                        conn,
+                        f"SELECT {colunas_select_curso(campos)} FROM cursos WHERE id IN ({placeholders})",
+                        tuple(lote),
+                        fetch_all=True
+                    )
+                    for row in rows:
+                        cursos[row['id']] = row
+            finally:
+                conn.commit()
+        
+        upserted, deleted, aulas = [], [], []
+        for curso_id, (tipo, estado) in sorted(alteracoes.items()):
+            if curso_id not in cursos:
+                # Removido (ou criado e removido) depois de since
+                deleted.append(curso_id)
+                continue
+            upserted.append(montar_curso(cursos[curso_id], campos))
+            if not estado.vazio():
+                if formato == 'ranges':
+                    marcadas, desmarcadas = estado.marcadas.ranges(), estado.desmarcadas.ranges()
+                else:
+                    marcadas, desmarcadas = estado.marcadas.numbers(), estado.desmarcadas.numbers()
+                aulas.append({'curso_id': curso_id, 'marcadas': marcadas, 'desmarcadas': desmarcadas})
+        
+        return create_success_response({
+            'since': since,
+            'version': version,
+            'upserted': upserted,
+            'deleted': deleted,
+            'aulas': aulas
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao buscar alterações desde a versão {request.args.get('since')}: {str(e)}")
+        return create_error_response(
+            "Erro ao acessar o banco de dados",
+            500,
+            str(e)
+        )
+
 # ===============================
 # ENDPOINTS DE UTILIDADE
 # ===============================
@@ -806,6 +1730,12 @@ def health_check():
             'success': True,
             'message': 'API funcionando corretamente',
             'database_type': DATABASE_TYPE,
+            'performance_profile': db_manager.get_profile_info(),
+            'pool': db_manager.pool.stats(),
+            'cache': {**response_cache.stats(), 'coherence': cache_coherence.stats()},
+            'write_queue': write_queue.stats(),
+            'json_encoder': app.json.encoder,
+            'compression': compressor.stats(),
             'timestamp': datetime.now().isoformat()
         }), 200
         
@@ -819,30 +1749,29 @@ def health_check():
         }), 503
 
 @app.route('/api/stats', methods=['GET'])
+@conditional_get
+@cached_response('stats')
 def get_stats():
     """
-    Endpoint para obter estatísticas gerais.
+    Endpoint para obter estatísticas gerais (leitura de uma linha materializada).
     """
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Total de cursos
-        cursor.execute('SELECT COUNT(*) as count FROM cursos')
-        total_cursos = cursor.fetchone()['count']
-        
-        # Total de aulas concluídas
-        cursor.execute('SELECT COUNT(*) as count FROM aulas_concluidas')
-        total_aulas_concluidas = cursor.fetchone()['count']
-        
-        # Total de aulas disponíveis
-        cursor.execute('SELECT SUM(total_aulas) as sum FROM cursos')
-        total_aulas_disponiveis = cursor.fetchone()['sum'] or 0
+        # Totais materializados (mantidos por triggers, ver init_db.py)
+        cursor.execute('''
+            SELECT total_cursos, total_aulas_concluidas, total_aulas_disponiveis
+            FROM estatisticas
+            WHERE id = 1
+        ''')
+        estatisticas = cursor.fetchone()
+        total_cursos = estatisticas['total_cursos']
+        total_aulas_concluidas = estatisticas['total_aulas_concluidas']
+        total_aulas_disponiveis = estatisticas['total_aulas_disponiveis']
         
         # Progresso geral
-        progresso_geral = 0.0
-        if total_aulas_disponiveis > 0:
-            progresso_geral = round((total_aulas_concluidas / total_aulas_disponiveis) * 100, 1)
+        progresso_geral = calcular_progresso(total_aulas_concluidas, total_aulas_disponiveis)
         
         conn.close()
         
@@ -862,6 +1791,10 @@ def get_stats():
             'error': f'Erro ao obter estatísticas: {str(e)}'
         }), 500
 
+# Frontend na mesma origem (opcional, SERVE_FRONTEND=1)
+if SERVE_FRONTEND:
+    register_frontend(app)
+
 # ===============================
 # TRATAMENTO DE ERROS
 # ===============================
@@ -0,0 +1,366 @@
+"""
+ASGI entry point: the same /api/* surface as wsgi.py, for many long-lived
+connections.
+
+    python init_db.py
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    # or pre-forked, with the settings of gunicorn.conf.py:
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+Requests run the Flask app (routing, validation, serialization, CORS, caches) on
+a dedicated thread pool, so database work never blocks the event loop. Two kinds
+of request hand their waiting over to the loop instead of holding a thread:
+
+- GET /api/events: Flask validates the request and builds the headers, then the
+  stream is fed by one EventHub per process, which polls the journal on its own
+  thread and wakes every subscriber at once. An idle client costs a coroutine.
+- GET /api/changes?wait=N: when nothing changed yet, the loop waits for the hub
+  to see a newer data version and then runs the request again.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app import app as flask_app, db_manager, event_feed, ASGI_STREAM, ASGI_ESPERA
+from events import KEEP_ALIVE
+from config import ASGI_EXECUTOR_THREADS, EVENTS_LOG_SIZE
+
+logger = logging.getLogger(__name__)
+
+class EventHub:
+    """
+    Fan-out of the event journal to asyncio subscribers, one per process.
+    
+    A single watcher task polls PRAGMA data_version on a dedicated connection and
+    thread, keeps the latest frames in memory (ring_size of them) and wakes all
+    waiting subscribers with one asyncio.Event. A subscriber that falls behind the
+    ring catches up from the database on the request executor.
+    """
+    def __init__(self, feed, connection_factory, ring_size=EVENTS_LOG_SIZE):
+        self.feed = feed
+        self.ring_size = ring_size
+        self._factory = connection_factory
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self.version = None
+    
+    async def stream(self, executor, last_event_id, stop):
+        """SSE frames for one client, until max_duration or until `stop` is done"""
+        await self._ensure_started()
+        loop = asyncio.get_running_loop()
+        last_event_id, frames = await loop.run_in_executor(executor, self._catch_up, last_event_id, True)
+        for frame in frames:
+            yield frame
+        
+        inicio = ultimo_envio = time.monotonic()
+        while not stop.done():
+            changed = self._changed
+            if last_event_id < self._floor:
+                last_event_id, frames = await loop.run_in_executor(executor, self._catch_up, last_event_id, False)
+            else:
+                frames = self._from_ring(last_event_id)
+                if frames:
+                    last_event_id = self._ring[-1][0]
+            for frame in frames:
+                yield frame
+                ultimo_envio = time.monotonic()
+            
+            agora = time.monotonic()
+            restante = self.feed.max_duration - (agora - inicio)
+            if restante <= 0:
+                return
+            if agora - ultimo_envio >= self.feed.heartbeat:
+                yield KEEP_ALIVE
+                ultimo_envio = agora
+            if not frames:
+                espera = min(restante, self.feed.heartbeat - (time.monotonic() - ultimo_envio))
+                await self._wait(changed, stop, espera)
+    
+    async def wait_version(self, since, timeout, stop):
+        """Wait until the data version is newer than since, timeout or `stop`"""
+        await self._ensure_started()
+        limite = time.monotonic() + timeout
+        while self.version <= since and not stop.done():
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return
+            await self._wait(self._changed, stop, restante)
+    
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.shutdown(wait=False)
+            self._thread = None
+        self._loop = None
+    
+    async def _ensure_started(self):
+        # asyncio objects belong to one loop (and process): build them lazily
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self.close()
+            self._loop = loop
+            self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='event-hub')
+            self._ring = deque(maxlen=self.ring_size)  # (event id, frame)
+            self._floor = None  # Every event after this id is in the ring
+            self._changed = asyncio.Event()
+            self._ready = asyncio.Event()
+            self._task = loop.create_task(self._watch())
+        await self._ready.wait()
+    
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        connection = None
+        pragma_version = None
+        while True:
+            try:
+                if connection is None:
+                    connection = await loop.run_in_executor(self._thread, self._factory)
+                    pragma_version = None
+                    last_id, _ = await loop.run_in_executor(self._thread, self.feed.prelude, connection, None)
+                    if self._floor is None:
+                        self._floor = last_id
+                    else:
+                        # Reconnected: resume right after the last frame we published
+                        last_id = self._ring[-1][0] if self._ring else self._floor
+                
+                atual, novos, version = await loop.run_in_executor(
+                    self._thread, self._poll, connection, pragma_version, last_id
+                )
+                if atual != pragma_version:
+                    pragma_version = atual
+                    if novos:
+                        last_id = novos[-1][0]
+                    self._publish(novos, version)
+                self._ready.set()
+            except asyncio.CancelledError:
+                if connection is not None:
+                    connection.close()
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao ler o feed de eventos: {str(e)}")
+                if connection is not None:
+                    connection.close()
+                connection = None
+            await asyncio.sleep(self.feed.poll_interval)
+    
+    def _poll(self, connection, pragma_version, last_id):
+        # Runs on the hub thread; reads only after another connection committed
+        atual = connection.execute('PRAGMA data_version').fetchone()[0]
+        if atual == pragma_version:
+            return atual, [], self.version
+        return atual, self.feed.frames_after(connection, last_id), db_manager.get_data_version(connection)
+    
+    def _publish(self, novos, version):
+        for event_id, frame in novos:
+            if len(self._ring) == self._ring.maxlen:
+                self._floor = self._ring[0][0]
+            self._ring.append((event_id, frame))
+        self.version = version
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    def _from_ring(self, last_event_id):
+        frames = []
+        for event_id, frame in reversed(self._ring):
+            if event_id <= last_event_id:
+                break
+            frames.append(frame)
+        frames.reverse()
+        return frames
+    
+    def _catch_up(self, last_event_id, abertura):
+        with db_manager.connection() as connection:
+            frames = []
+            if abertura:
+                last_event_id, frames = self.feed.prelude(connection, last_event_id)
+            for last_event_id, frame in self.feed.frames_after(connection, last_event_id):
+                frames.append(frame)
+        return last_event_id, frames
+    
+    async def _wait(self, changed, stop, timeout):
+        waiter = asyncio.ensure_future(changed.wait())
+        try:
+            await asyncio.wait({waiter, stop}, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+
+class AsgiApp:
+    """
+    Serves a WSGI app over ASGI, running it on a thread pool, and takes over the
+    requests it marks in the environ (ASGI_STREAM, ASGI_ESPERA; see app.py).
+    """
+    def __init__(self, wsgi_app, hub, threads=ASGI_EXECUTOR_THREADS):
+        self.wsgi_app = wsgi_app
+        self.hub = hub
+        self.threads = max(threads, 1)
+        self._executor = None
+        self._pid = None
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Tipo de conexão não suportado: {scope['type']}")
+        
+        loop = asyncio.get_running_loop()
+        body = await self._read_body(receive)
+        disconnected = loop.create_future()
+        watcher = loop.create_task(self._watch_disconnect(receive, disconnected))
+        try:
+            environ = self._environ(scope, body)
+            status, headers, iterable = await loop.run_in_executor(self.executor, self._call, environ)
+            
+            espera = environ[ASGI_ESPERA]
+            if isinstance(espera, dict):
+                # Nothing new yet: wait on the loop, then answer with a fresh run
+                await loop.run_in_executor(self.executor, self._close, iterable)
+                await self.hub.wait_version(espera['since'], espera['timeout'], disconnected)
+                environ = self._environ(scope, body)
+                environ[ASGI_ESPERA] = 'aguardado'
+                status, headers, iterable = await loop.run_in_executor(self.executor, self._call, environ)
+            
+            stream = environ[ASGI_STREAM]
+            if isinstance(stream, dict):
+                await loop.run_in_executor(self.executor, self._close, iterable)
+                headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+                await self._start(send, status, headers)
+                async for frame in self.hub.stream(self.executor, stream['last_event_id'], disconnected):
+                    await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            
+            await self._send_wsgi_body(loop, send, status, headers, iterable)
+        finally:
+            watcher.cancel()
+    
+    @property
+    def executor(self):
+        # Threads do not survive fork(); each worker process builds its own pool
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+            self._pid = os.getpid()
+        return self._executor
+    
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.hub.close()
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+    
+    async def _watch_disconnect(self, receive, disconnected):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                if not disconnected.done():
+                    disconnected.set_result(True)
+                return
+    
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            # The body is fully buffered, so this holds for chunked uploads too
+            'wsgi.input_terminated': True,
+            ASGI_STREAM: None,
+            ASGI_ESPERA: None
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'content-length':
+                key = 'HTTP_' + name.upper().replace('-', '_')
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        environ['CONTENT_LENGTH'] = str(len(body))
+        return environ
+    
+    def _call(self, environ):
+        resposta = {}
+        def start_response(status, headers, exc_info=None):
+            resposta['status'] = int(status.split(' ', 1)[0])
+            resposta['headers'] = headers
+            return resposta.setdefault('escritos', []).append
+        
+        iterable = self.wsgi_app(environ, start_response)
+        return resposta['status'], resposta['headers'], (resposta.get('escritos', []), iterable)
+    
+    def _close(self, iterable):
+        close = getattr(iterable[1], 'close', None)
+        if close is not None:
+            close()
+    
+    async def _start(self, send, status, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+    
+    async def _send_wsgi_body(self, loop, send, status, headers, iterable):
+        escritos, corpo = iterable
+        iterator = iter(corpo)
+        fim = object()
+        try:
+            await self._start(send, status, headers)
+            for chunk in escritos:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            while True:
+                # Streaming bodies may touch the database: one chunk per executor call
+                chunk = await loop.run_in_executor(self.executor, next, iterator, fim)
+                if chunk is fim:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await loop.run_in_executor(self.executor, self._close, iterable)
+
+event_hub = EventHub(event_feed, db_manager.new_connection)
+app = AsgiApp(flask_app, event_hub)
@@ -0,0 +1,362 @@
+import logging
+from config import AULAS_STORAGE
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_ROWS = 'rows'
+LAYOUT_BITMAP = 'bitmap'
+LAYOUTS = (LAYOUT_ROWS, LAYOUT_BITMAP)
+
+# Insert one lesson only if the course exists, the lesson is within total_aulas
+# and the course uses the rows layout. UPSERT and the window function in
+# listar_intervalos are always available: init_db.py requires SQLite 3.31
+_MARCAR_GUARDADO = '''
+    INSERT INTO aulas_concluidas (curso_id, numero_aula)
+    SELECT id, ? FROM cursos
+    WHERE id = ? AND total_aulas >= ?
+      AND NOT EXISTS (SELECT 1 FROM aulas_bitmap WHERE curso_id = cursos.id)
+    ON CONFLICT (curso_id, numero_aula) DO NOTHING
+'''
+
+_DESMARCAR_GUARDADO = '''
+    DELETE FROM aulas_concluidas
+    WHERE curso_id = ? AND numero_aula = ?
+      AND numero_aula <= (SELECT total_aulas FROM cursos WHERE id = ?)
+'''
+
+class Bitset:
+    """
+    In-memory set of lesson numbers (1-based) backed by a Python int.
+    Lesson n is bit n-1; the BLOB form is little-endian bytes.
+    """
+    def __init__(self, value=0):
+        self.value = value
+    
+    @classmethod
+    def from_blob(cls, blob):
+        return cls(int.from_bytes(blob, 'little') if blob else 0)
+    
+    @classmethod
+    def from_numbers(cls, numeros):
+        value = 0
+        for numero in numeros:
+            value |= 1 << (numero - 1)
+        return cls(value)
+    
+    def to_blob(self):
+        return self.value.to_bytes((self.value.bit_length() + 7) // 8, 'little')
+    
+    def contains(self, numero):
+        return bool(self.value >> (numero - 1) & 1)
+    
+    def set(self, numero):
+        self.value |= 1 << (numero - 1)
+    
+    def clear(self, numero):
+        self.value &= ~(1 << (numero - 1))
+    
+    @staticmethod
+    def range_mask(inicio, fim):
+        """Mask with the bits of lessons inicio..fim (inclusive)"""
+        if fim < inicio:
+            return 0
+        return ((1 << (fim - inicio + 1)) - 1) << (inicio - 1)
+    
+    def set_range(self, inicio, fim):
+        self.value |= self.range_mask(inicio, fim)
+    
+    def clear_range(self, inicio, fim):
+        self.value &= ~self.range_mask(inicio, fim)
+    
+    def popcount(self):
+        return bin(self.value).count('1')
+    
+    def ranges(self):
+        """Sorted [start, end] runs of consecutive lessons, in one pass over the bits"""
+        # One character per lesson, lesson 1 first. Shifting or masking the int
+        # instead would copy it on every step (quadratic for large courses).
+        bits = bin(self.value)[:1:-1]
+        ranges = []
+        inicio = bits.find('1')
+        while inicio != -1:
+            fim = bits.find('0', inicio)
+            if fim == -1:
+                fim = len(bits)
+            ranges.append([inicio + 1, fim])
+            inicio = bits.find('1', fim)
+        return ranges
+    
+    def numbers(self):
+        """Sorted list of the lesson numbers in the set"""
+        return [numero for numero, bit in enumerate(bin(self.value)[:1:-1], 1) if bit == '1']
+
+class AulasStore:
+    """
+    Completed-lesson storage with two layouts, chosen per course:
+    
+    - rows:   one row per lesson in aulas_concluidas. The counters on cursos and
+              estatisticas are maintained by triggers.
+    - bitmap: one BLOB per course in aulas_bitmap. The counters are maintained
+              here, since SQL cannot popcount a BLOB.
+    
+    A course uses the bitmap layout when it has a row in aulas_bitmap, so courses
+    can be migrated one at a time while the API keeps serving them.
+    """
+    def __init__(self, default_layout=AULAS_STORAGE):
+        if default_layout not in LAYOUTS:
+            logger.warning(f"Armazenamento de aulas desconhecido '{default_layout}', usando 'rows'")
+            default_layout = LAYOUT_ROWS
+        self.default_layout = default_layout
+    
+    def _begin_write(self, connection):
+        """Take the write lock before a read-modify-write of a bitmap"""
+        if not connection.in_transaction:
+            connection.execute('BEGIN IMMEDIATE')
+    
+    def layout(self, connection, curso_id):
+        row = connection.execute('SELECT 1 FROM aulas_bitmap WHERE curso_id = ?', (curso_id,)).fetchone()
+        return LAYOUT_BITMAP if row else LAYOUT_ROWS
+    
+    def iniciar_curso(self, connection, curso_id):
+        """Prepare storage for a newly created course"""
+        if self.default_layout == LAYOUT_BITMAP:
+            connection.execute('INSERT OR IGNORE INTO aulas_bitmap (curso_id, bitmap) VALUES (?, ?)', (curso_id, b''))
+    
+    def listar(self, connection, curso_id):
+        """Sorted list of completed lesson numbers"""
+        bitset = self._load_bitset(connection, curso_id)
+        if bitset is not None:
+            return bitset.numbers()
+        
+        rows = connection.execute(
+            'SELECT numero_aula FROM aulas_concluidas WHERE curso_id = ? ORDER BY numero_aula',
+            (curso_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+    
+    def listar_intervalos(self, connection, curso_id):
+        """Completed lessons as sorted [start, end] ranges (run-length encoded)"""
+        bitset = self._load_bitset(connection, curso_id)
+        if bitset is not None:
+            return bitset.ranges()
+        
+        # Gaps and islands: consecutive lessons share numero_aula - row number
+        rows = connection.execute('''
+            SELECT MIN(numero_aula), MAX(numero_aula)
+            FROM (
+                SELECT numero_aula, numero_aula - ROW_NUMBER() OVER (ORDER BY numero_aula) AS grupo
+                FROM aulas_concluidas
+                WHERE curso_id = ?
+            )
+            GROUP BY grupo
+            ORDER BY 1
+        ''', (curso_id,)).fetchall()
+        return [[row[0], row[1]] for row in rows]
+    
+    def aplicar(self, connection, curso_id, marcar=(), desmarcar=()):
+        """
+        Mark and unmark lessons in the caller's transaction.
+        Returns the lessons whose state actually changed: {'marcadas': [...], 'desmarcadas': [...]}
+        """
+        self._begin_write(connection)
+        bitset = self._load_bitset(connection, curso_id)
+        if bitset is not None:
+            marcadas = sorted(numero for numero in set(marcar) if not bitset.contains(numero))
+            desmarcadas = sorted(numero for numero in set(desmarcar) if bitset.contains(numero))
+            for numero in marcadas:
+                bitset.set(numero)
+            for numero in desmarcadas:
+                bitset.clear(numero)
+            self._save_bitset(connection, curso_id, bitset, len(marcadas) - len(desmarcadas))
+            return {'marcadas': marcadas, 'desmarcadas': desmarcadas}
+        
+        marcar = set(marcar)
+        desmarcar = set(desmarcar)
+        if not marcar and not desmarcar:
+            return {'marcadas': [], 'desmarcadas': []}
+        
+        # One indexed range read tells which requested lessons are already done
+        # (exact, since the write lock is held)
+        envolvidas = marcar | desmarcar
+        existentes = {
+            row[0] for row in connection.execute(
+                'SELECT numero_aula FROM aulas_concluidas WHERE curso_id = ? AND numero_aula BETWEEN ? AND ?',
+                (curso_id, min(envolvidas), max(envolvidas))
+            ).fetchall()
+        }
+        marcadas = sorted(marcar - existentes)
+        desmarcadas = sorted(desmarcar & existentes)
+        
+        # Apply each set with a single executemany
+        if marcadas:
+            connection.executemany(
+                'INSERT OR IGNORE INTO aulas_concluidas (curso_id, numero_aula) VALUES (?, ?)',
+                [(curso_id, numero) for numero in marcadas]
+            )
+        if desmarcadas:
+            connection.executemany(
+                'DELETE FROM aulas_concluidas WHERE curso_id = ? AND numero_aula = ?',
+                [(curso_id, numero) for numero in desmarcadas]
+            )
+        return {'marcadas': marcadas, 'desmarcadas': desmarcadas}
+    
+    def alternar(self, connection, curso_id, numero_aula, concluida):
+        """
+        Mark or unmark a single lesson in the caller's transaction.
+        
+        Rows layout: one guarded INSERT/DELETE (a no-op when the course is missing,
+        the lesson is out of bounds or the course uses the bitmap layout) plus one
+        read of the course state, whose counter the triggers already updated.
+        Bitmap courses then take the bitmap path.
+        
+        Returns None if the course does not exist, otherwise
+        {'total_aulas', 'total_concluidas', 'alterada'}. A lesson beyond
+        total_aulas is left untouched; the caller rejects it.
+        """
+        if concluida:
+            cursor = connection.execute(_MARCAR_GUARDADO, (numero_aula, curso_id, numero_aula))
+        else:
+            cursor = connection.execute(_DESMARCAR_GUARDADO, (curso_id, numero_aula, curso_id))
+        alterada = cursor.rowcount > 0
+        
+        row = connection.execute('''
+            SELECT total_aulas, aulas_concluidas_count,
+                   EXISTS (SELECT 1 FROM aulas_bitmap WHERE curso_id = cursos.id)
+            FROM cursos WHERE id = ?
+        ''', (curso_id,)).fetchone()
+        if row is None:
+            return None
+        total_aulas, total_concluidas, bitmap = row
+        
+        if bitmap and numero_aula <= total_aulas:
+            self._begin_write(connection)
+            bitset = self._load_bitset(connection, curso_id)
+            alterada = bitset.contains(numero_aula) != concluida
+            if alterada:
+                if concluida:
+                    bitset.set(numero_aula)
+                else:
+                    bitset.clear(numero_aula)
+                delta = 1 if concluida else -1
+                self._save_bitset(connection, curso_id, bitset, delta)
+                total_concluidas += delta
+        
+        return {
+            'total_aulas': total_aulas,
+            'total_concluidas': total_concluidas,
+            'alterada': alterada
+        }
+    
+    def aplicar_intervalo(self, connection, curso_id, inicio, fim, concluida):
+        """
+        Mark (concluida=True) or unmark lessons inicio..fim with one set-based
+        statement or bitmap operation. Returns how many lessons changed state.
+        """
+        self._begin_write(connection)
+        bitset = self._load_bitset(connection, curso_id)
+        if bitset is not None:
+            antes = bitset.popcount()
+            if concluida:
+                bitset.set_range(inicio, fim)
+            else:
+                bitset.clear_range(inicio, fim)
+            delta = bitset.popcount() - antes
+            self._save_bitset(connection, curso_id, bitset, delta)
+            return abs(delta)
+        
+        if concluida:
+            cursor = connection.execute('''
+                INSERT OR IGNORE INTO aulas_concluidas (curso_id, numero_aula)
+                WITH RECURSIVE seq(n) AS (
+                    SELECT ? UNION ALL SELECT n + 1 FROM seq WHERE n < ?
+                )
+                SELECT ?, n FROM seq
+            ''', (inicio, fim, curso_id))
+        else:
+            cursor = connection.execute(
+                'DELETE FROM aulas_concluidas WHERE curso_id = ? AND numero_aula BETWEEN ? AND ?',
+                (curso_id, inicio, fim)
+            )
+        return cursor.rowcount
+    
+    def remover_curso(self, connection, curso_id):
+        """Delete every completion of a course (before the course itself is deleted)"""
+        self._begin_write(connection)
+        bitset = self._load_bitset(connection, curso_id)
+        if bitset is not None:
+            self._adjust_counters(connection, curso_id, -bitset.popcount())
+            connection.execute('DELETE FROM aulas_bitmap WHERE curso_id = ?', (curso_id,))
+        connection.execute('DELETE FROM aulas_concluidas WHERE curso_id = ?', (curso_id,))
+    
+    def migrar_curso(self, connection, curso_id, destino):
+        """Convert one course to the `destino` layout (caller commits). Returns True if it changed."""
+        self._begin_write(connection)
+        if self.layout(connection, curso_id) == destino:
+            return False
+        
+        if destino == LAYOUT_BITMAP:
+            numeros = self.listar(connection, curso_id)
+            # The delete triggers decrement the counters; restore them afterwards
+            connection.execute('DELETE FROM aulas_concluidas WHERE curso_id = ?', (curso_id,))
+            self._adjust_counters(connection, curso_id, len(numeros))
+            connection.execute(
+                'INSERT INTO aulas_bitmap (curso_id, bitmap) VALUES (?, ?)',
+                (curso_id, Bitset.from_numbers(numeros).to_blob())
+            )
+        else:
+            numeros = self._load_bitset(connection, curso_id).numbers()
+            connection.execute('DELETE FROM aulas_bitmap WHERE curso_id = ?', (curso_id,))
+            # The insert triggers increment the counters; compensate beforehand
+            self._adjust_counters(connection, curso_id, -len(numeros))
+            connection.executemany(
+                'INSERT OR IGNORE INTO aulas_concluidas (curso_id, numero_aula) VALUES (?, ?)',
+                [(curso_id, numero) for numero in numeros]
+            )
+        return True
+    
+    def migrar_todos(self, connection, destino):
+        """
+        Online migration: converts every course to `destino`, one short
+        transaction per course, so concurrent requests are only briefly blocked.
+        Returns the number of courses converted.
+        """
+        if destino not in LAYOUTS:
+            raise ValueError(f"Layout inválido: {destino}")
+        
+        curso_ids = [row[0] for row in connection.execute('SELECT id FROM cursos ORDER BY id').fetchall()]
+        migrados = 0
+        for curso_id in curso_ids:
+            try:
+                if self.migrar_curso(connection, curso_id, destino):
+                    migrados += 1
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        return migrados
+    
+    def _load_bitset(self, connection, curso_id):
+        row = connection.execute('SELECT bitmap FROM aulas_bitmap WHERE curso_id = ?', (curso_id,)).fetchone()
+        return Bitset.from_blob(row[0]) if row else None
+    
+    def _save_bitset(self, connection, curso_id, bitset, delta):
+        connection.execute(
+            'UPDATE aulas_bitmap SET bitmap = ? WHERE curso_id = ?',
+            (bitset.to_blob(), curso_id)
+        )
+        self._adjust_counters(connection, curso_id, delta)
+    
+    def _adjust_counters(self, connection, curso_id, delta):
+        if not delta:
+            return
+        connection.execute(
+            'UPDATE cursos SET aulas_concluidas_count = aulas_concluidas_count + ? WHERE id = ?',
+            (delta, curso_id)
+        )
+        connection.execute(
+            'UPDATE estatisticas SET total_aulas_concluidas = total_aulas_concluidas + ? WHERE id = 1',
+            (delta,)
+        )
+
+# Global completed-lesson store
+aulas_store = AulasStore()
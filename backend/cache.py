@@ -0,0 +1,227 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+import os
+from config import CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_INVALIDATION_LOG_SIZE
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """
+    In-process LRU + TTL cache for serialized read responses.
+    
+    Entries are tagged (e.g. 'cursos', 'curso:7', 'stats') and stored together with
+    the data version they were computed at. invalidate() drops every entry of the
+    given tags and raises their minimum version, so a reader that started before a
+    write cannot store its (now stale) result afterwards.
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, enabled=CACHE_ENABLED):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._min_versions = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'rejected': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+    
+    def get(self, key):
+        """Return the cached value for `key`, or None"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            
+            if entry['expires_at'] <= time.monotonic():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry['value']
+    
+    def set(self, key, value, tags, version):
+        """Store a value computed at data version `version` unless a newer write invalidated its tags"""
+        if not self.enabled:
+            return False
+        
+        with self._lock:
+            if any(version < self._min_versions.get(tag, 0) for tag in tags):
+                self._stats['rejected'] += 1
+                return False
+            
+            if key in self._entries:
+                self._remove(key)
+            
+            self._entries[key] = {
+                'value': value,
+                'tags': tuple(tags),
+                'version': version,
+                'expires_at': time.monotonic() + self.ttl
+            }
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._stats['stores'] += 1
+            
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+            return True
+    
+    def invalidate(self, tags, version):
+        """Drop entries of `tags` computed before `version` and reject older results from now on"""
+        with self._lock:
+            for tag in tags:
+                if version > self._min_versions.get(tag, 0):
+                    self._min_versions[tag] = version
+                for key in list(self._tags.get(tag, ())):
+                    if self._entries[key]['version'] < version:
+                        self._remove(key)
+                        self._stats['invalidations'] += 1
+    
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+    
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry['tags']:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+class CacheCoherence:
+    """
+    Keeps a process-local ResponseCache coherent with writes made by other worker
+    processes, using the SQLite file as the shared channel.
+    
+    Every write records its data version and invalidated tags in the
+    cache_invalidations table (same transaction). Before each cache lookup sync() runs
+    PRAGMA data_version on a dedicated connection, which only changes after another
+    connection committed; only then the new log rows are read and their tags dropped.
+    """
+    def __init__(self, cache, connection_factory, log_size=CACHE_INVALIDATION_LOG_SIZE):
+        self.cache = cache
+        self.log_size = log_size
+        self._factory = connection_factory
+        self._connection = None
+        self._pid = None
+        self._pragma_version = None
+        self._last_version = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'syncs': 0,
+            'writes_seen': 0,
+            'full_clears': 0
+        }
+    
+    def record(self, connection, tags, version):
+        """Log the tags invalidated by a write (call inside the write transaction)"""
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_invalidations (version, tags) VALUES (?, ?)',
+            (version, ','.join(tags))
+        )
+        connection.execute('DELETE FROM cache_invalidations WHERE version <= ?', (version - self.log_size,))
+    
+    def sync(self):
+        """Apply invalidations committed by other processes since the last call"""
+        if not self.cache.enabled:
+            return
+        
+        with self._lock:
+            try:
+                self._ensure_connection()
+                pragma_version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+                if pragma_version == self._pragma_version:
+                    return
+                self._pragma_version = pragma_version
+                self._stats['syncs'] += 1
+                self._apply_log()
+            except Exception as e:
+                # Without a reliable view of foreign writes, start from scratch
+                logger.warning(f"Falha ao sincronizar cache entre processos: {str(e)}")
+                self._reset_connection()
+                self.cache.clear()
+                self._stats['full_clears'] += 1
+    
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'last_version': self._last_version}
+    
+    def _apply_log(self):
+        current = self._connection.execute('SELECT version FROM data_version WHERE id = 1').fetchone()
+        current = current[0] if current else 0
+        if current <= self._last_version:
+            return
+        
+        rows = self._connection.execute(
+            'SELECT version, tags FROM cache_invalidations WHERE version > ? ORDER BY version',
+            (self._last_version,)
+        ).fetchall()
+        
+        # Versions are consecutive; a gap means the log was compacted past us
+        if not rows or rows[0][0] != self._last_version + 1:
+            self.cache.clear()
+            self._stats['full_clears'] += 1
+        else:
+            for version, tags in rows:
+                self.cache.invalidate(tags.split(','), version)
+        
+        self._stats['writes_seen'] += current - self._last_version
+        self._last_version = current
+    
+    def _ensure_connection(self):
+        # A connection inherited through fork() must not be reused
+        if self._connection is not None and self._pid == os.getpid():
+            return
+        self._connection = self._factory()
+        self._pid = os.getpid()
+        self._pragma_version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+        current = self._connection.execute('SELECT version FROM data_version WHERE id = 1').fetchone()
+        self._last_version = current[0] if current else 0
+        # Nothing cached by this process can predate the version we start from
+        self.cache.clear()
+    
+    def _reset_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+
+# Global response cache instance
+response_cache = ResponseCache()
@@ -0,0 +1,112 @@
+import gzip
+import logging
+import threading
+from flask import request
+from config import (
+    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE,
+    COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+)
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Content-Encoding values, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+def is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith(COMPRESSIBLE_TYPES) or mimetype.endswith('+json'))
+
+def etag_variants(etag):
+    """The ETag of every encoding of one representation (see Compressor)"""
+    return [etag] + [f'{etag}-{encoding}' for encoding in ENCODINGS]
+
+def negotiate(accept_encodings, available=ENCODINGS):
+    """Best encoding in `available` accepted by the client, or None for identity"""
+    melhor, melhor_q = None, 0
+    for encoding in available:
+        q = accept_encodings.quality(encoding)
+        if q > melhor_q:
+            melhor, melhor_q = encoding, q
+    return melhor
+
+class Compressor:
+    """
+    Negotiated gzip/brotli compression of API responses (an after_request hook).
+    
+    Only complete bodies of compressible types and at least min_size bytes are
+    compressed; streamed responses (SSE) and file responses pass through. A
+    compressed response gets its own strong ETag (the identity ETag plus the
+    encoding), since its bytes differ; conditional_get accepts every variant.
+    """
+    def __init__(self, min_size=COMPRESSION_MIN_SIZE, gzip_level=COMPRESSION_GZIP_LEVEL,
+                 brotli_quality=COMPRESSION_BROTLI_QUALITY, enabled=COMPRESSION_ENABLED):
+        self.min_size = max(min_size, 0)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'compressed': 0, 'bytes_in': 0, 'bytes_out': 0}
+    
+    def init_app(self, app, prefix='/api/'):
+        self.prefix = prefix
+        app.after_request(self.compress_response)
+    
+    def compress_response(self, response):
+        if not self.enabled or not request.path.startswith(self.prefix):
+            return response
+        if not is_compressible(response.mimetype):
+            return response
+        # Compressible whether or not this one is: caches must key on the encoding
+        response.vary.add('Accept-Encoding')
+        
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+        
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        dados = response.get_data()
+        if len(dados) < self.min_size:
+            return response
+        
+        comprimido = self.compress(dados, encoding)
+        response.set_data(comprimido)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        
+        with self._lock:
+            self._stats['compressed'] += 1
+            self._stats['bytes_in'] += len(dados)
+            self._stats['bytes_out'] += len(comprimido)
+        return response
+    
+    def compress(self, dados, encoding, maximo=False):
+        """Compress bytes; maximo=True trades time for size (precompressed files)"""
+        if encoding == 'br':
+            return brotli.compress(dados, quality=11 if maximo else self.brotli_quality)
+        # mtime=0 keeps the output (and thus file ETags) stable
+        return gzip.compress(dados, compresslevel=9 if maximo else self.gzip_level, mtime=0)
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            'enabled': self.enabled,
+            'encodings': list(ENCODINGS),
+            'min_size': self.min_size,
+            'ratio': round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None
+        }
+
+# Global compressor instance
+compressor = Compressor()
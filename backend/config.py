@@ -7,8 +7,95 @@ DATABASE_TYPE = 'sqlite'
 # SQLite Configuration - permanent location
 SQLITE_DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'database.sqlite')
 
+# Connection pool configuration
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))            # Máximo de conexões abertas
+DB_POOL_MAX_USES = int(os.environ.get('DB_POOL_MAX_USES', 1000)) # Reciclar conexão após N usos
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))   # Segundos aguardando conexão livre
+
+# SQLite performance profiles (PRAGMAs applied to every new connection)
+DB_PERFORMANCE_PROFILES = {
+    # Nenhuma transação confirmada é perdida em queda de energia
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -8000,           # KiB (valor negativo) - ~8 MB
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'wal_autocheckpoint': 1000     # Páginas
+    },
+    # Menor latência de escrita; transações recentes podem ser perdidas em queda de energia
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,          # ~64 MB
+        'mmap_size': 268435456,        # 256 MB
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 4000
+    }
+}
+DB_PERFORMANCE_PROFILE = os.environ.get('DB_PERFORMANCE_PROFILE', 'durable')
+
+# Response cache configuration (cache em memória das rotas de leitura)
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 512))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 300))              # Segundos
+CACHE_INVALIDATION_LOG_SIZE = int(os.environ.get('CACHE_INVALIDATION_LOG_SIZE', 1000))  # Escritas mantidas para outros processos
+
+# Fila de escrita com group commit (marcações de aulas)
+WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', '1') not in ('0', 'false', 'False')
+WRITE_QUEUE_LINGER_MS = float(os.environ.get('WRITE_QUEUE_LINGER_MS', 2))  # Espera por mais escritas antes do commit
+WRITE_QUEUE_MAX_BATCH = int(os.environ.get('WRITE_QUEUE_MAX_BATCH', 64))   # Máximo de operações por transação
+WRITE_QUEUE_MAX_DEPTH = int(os.environ.get('WRITE_QUEUE_MAX_DEPTH', 256))  # Escritas aguardando; além disso responde 503
+WRITE_QUEUE_DEADLINE = float(os.environ.get('WRITE_QUEUE_DEADLINE', 5))    # Segundos até a escrita começar; senão 503
+
+# Feed de eventos (Server-Sent Events em /api/events)
+EVENTS_LOG_SIZE = int(os.environ.get('EVENTS_LOG_SIZE', 1000))             # Eventos mantidos para retomada (Last-Event-ID)
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))  # Segundos entre verificações de novas escritas
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))           # Segundos sem eventos até enviar keep-alive
+EVENTS_MAX_DURATION = float(os.environ.get('EVENTS_MAX_DURATION', 300))    # Segundos por conexão; o cliente reconecta sozinho
+EVENTS_TOMBSTONE_RETENTION = int(os.environ.get('EVENTS_TOMBSTONE_RETENTION', 100000))  # Versões em que um curso removido segue no histórico compactado
+
+# Servidor WSGI de produção (gunicorn, ver gunicorn.conf.py)
+# O SQLite aceita um escritor por vez: poucos processos, várias threads de leitura cada
+WEB_BIND = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 2))                      # Processos (cada um com sua fila de escrita)
+WEB_THREADS = int(os.environ.get('WEB_THREADS', DB_POOL_SIZE))           # Threads por processo, até uma conexão do pool cada
+WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 30))                     # Segundos sem resposta do worker até reiniciá-lo
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))   # Segundos para concluir requisições no reload/parada
+WEB_KEEPALIVE = int(os.environ.get('WEB_KEEPALIVE', 5))                  # Segundos mantendo conexões HTTP ociosas
+WEB_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 0))            # Reciclar o worker após N requisições (0 = nunca)
+# Streams /api/events simultâneos por processo no servidor WSGI, onde cada um ocupa uma
+# thread; acima disso a resposta é 503. O servidor ASGI não tem esse limite
+EVENTS_MAX_WSGI_STREAMS = int(os.environ.get('EVENTS_MAX_WSGI_STREAMS', max(1, WEB_THREADS // 4)))
+
+# Servidor ASGI (asgi.py): as rotas rodam neste executor; streams e long polling
+# aguardam no loop de eventos, sem ocupar threads
+ASGI_EXECUTOR_THREADS = int(os.environ.get('ASGI_EXECUTOR_THREADS', DB_POOL_SIZE))
+
+# Serialização JSON das respostas: 'auto' (orjson se instalado), 'orjson' ou 'json'
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+
+# Listagens em streaming (stream=json|ndjson): linhas lidas do cursor em blocos deste tamanho
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 200))
+
+# Compressão das respostas /api/* (gzip; brotli se o módulo estiver instalado)
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') not in ('0', 'false', 'False')
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))          # Bytes; respostas menores vão sem compressão
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+
+# Frontend (frontend/dist) servido pelo Flask na mesma origem: sem preflight de CORS
+SERVE_FRONTEND = os.environ.get('SERVE_FRONTEND', '0') not in ('0', 'false', 'False')
+FRONTEND_DIST = os.environ.get('FRONTEND_DIST', os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'))
+CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE', 86400))  # Segundos que o navegador guarda o preflight
+
+# Armazenamento das aulas concluídas: 'rows' (uma linha por aula) ou 'bitmap' (BLOB por curso)
+# Define o layout de cursos novos; cursos existentes são convertidos com
+# python init_db.py --migrate-storage bitmap|rows
+AULAS_STORAGE = os.environ.get('AULAS_STORAGE', 'rows')
+
 # Removed MySQL Configuration as it's no longer needed
 
 def get_mysql_url():
     """Placeholder function to avoid errors - not used with SQLite"""
-    return None
\ No newline at end of file
+    return None
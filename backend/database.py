@@ -1,30 +1,254 @@
 import sqlite3
 import os
 import logging
-from config import DATABASE_TYPE, SQLITE_DATABASE_PATH
+import threading
+import time
+from contextlib import contextmanager
+from config import (
+    DATABASE_TYPE, SQLITE_DATABASE_PATH,
+    DB_POOL_SIZE, DB_POOL_MAX_USES, DB_POOL_TIMEOUT,
+    DB_PERFORMANCE_PROFILES, DB_PERFORMANCE_PROFILE, STREAM_CHUNK_SIZE
+)
 
 logger = logging.getLogger(__name__)
 
+# UPDATE ... RETURNING needs SQLite 3.35
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Order matters: journal_mode must be set before the WAL-specific settings
+PRAGMA_ORDER = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'wal_autocheckpoint')
+
+def get_performance_profile(name=DB_PERFORMANCE_PROFILE):
+    """Resolve a named PRAGMA profile, falling back to 'durable' when the name is unknown"""
+    if name not in DB_PERFORMANCE_PROFILES:
+        logger.warning(f"Perfil de desempenho desconhecido '{name}', usando 'durable'")
+        name = 'durable'
+    return name, DB_PERFORMANCE_PROFILES[name]
+
+class PooledConnection:
+    """
+    Wrapper around a pooled sqlite3 connection.
+    Calling close() returns the connection to the pool instead of closing it.
+    """
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self.uses = 0
+        self.released = True
+    
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+    
+    def close(self):
+        """Return the connection to the pool"""
+        if not self.released:
+            self._pool.release(self)
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of long-lived SQLite connections.
+    Fork-aware: a worker process forked from a preloaded parent starts empty.
+    """
+    def __init__(self, factory, size=DB_POOL_SIZE, max_uses=DB_POOL_MAX_USES, timeout=DB_POOL_TIMEOUT):
+        self._factory = factory
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._lock = threading.Condition(threading.Lock())
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_timeouts': 0,
+            'opened': 0,
+            'recycled': 0,
+            'discarded': 0
+        }
+    
+    def acquire(self):
+        """Check out a healthy connection, waiting up to `timeout` seconds if the pool is exhausted"""
+        self._ensure_process()
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            waited = False
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['wait_timeouts'] += 1
+                    raise Exception("Tempo esgotado aguardando conexão livre no pool")
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._lock.wait(remaining)
+            
+            pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                # Reserve the slot before opening outside the lock
+                self._open += 1
+        
+        if pooled is not None and not self._is_healthy(pooled):
+            self._discard(pooled)
+            with self._lock:
+                self._open += 1
+            pooled = None
+        
+        if pooled is None:
+            try:
+                pooled = PooledConnection(self, self._factory())
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._stats['opened'] += 1
+        
+        pooled.uses += 1
+        pooled.released = False
+        with self._lock:
+            self._stats['checkouts'] += 1
+        return pooled
+    
+    def release(self, pooled):
+        """Return a connection to the pool, recycling it after `max_uses` checkouts"""
+        pooled.released = True
+        try:
+            if pooled._connection.in_transaction:
+                pooled._connection.rollback()
+        except Exception as e:
+            logger.warning(f"Descartando conexão após falha no rollback: {str(e)}")
+            self._discard(pooled)
+            return
+        
+        if self.max_uses and pooled.uses >= self.max_uses:
+            self._discard(pooled, reason='recycled')
+            return
+        
+        with self._lock:
+            self._idle.append(pooled)
+            self._lock.notify()
+    
+    def close_all(self):
+        """Close every idle connection (connections in use are closed when released)"""
+        self._ensure_process()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+    
+    def stats(self):
+        """Return a snapshot of the pool statistics"""
+        with self._lock:
+            return {
+                **self._stats,
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle)
+            }
+    
+    def _ensure_process(self):
+        # SQLite connections must not cross fork(): the child forgets the parent's
+        # connections without closing them (closing could release the parent's locks)
+        if self._pid == os.getpid():
+            return
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = []
+        self._open = 0
+        self._pid = os.getpid()
+    
+    def _is_healthy(self, pooled):
+        try:
+            pooled._connection.execute('SELECT 1').fetchone()
+            return True
+        except Exception as e:
+            logger.warning(f"Conexão do pool inválida, reabrindo: {str(e)}")
+            return False
+    
+    def _discard(self, pooled, reason='discarded'):
+        try:
+            pooled._connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats[reason] += 1
+            self._lock.notify()
+
 class DatabaseManager:
     def __init__(self):
         # Permanently use SQLite
         self.db_type = 'sqlite'
+        self.profile_name, self.profile = get_performance_profile()
+        self.pool = ConnectionPool(self._get_sqlite_connection)
         
     def get_connection(self):
-        """Get SQLite database connection"""
+        """Get a pooled SQLite database connection (close() returns it to the pool)"""
         try:
-            return self._get_sqlite_connection()
+            return self.pool.acquire()
         except Exception as e:
             logger.error(f"Erro ao conectar com o banco de dados {self.db_type}: {str(e)}")
             raise Exception(f"Falha na conexão com o banco de dados: {str(e)}")
     
+    @contextmanager
+    def connection(self):
+        """Context manager that checks out a pooled connection and always returns it"""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def new_connection(self):
+        """Open a dedicated connection outside the pool (caller closes it)"""
+        return self._get_sqlite_connection()
+    
     def _get_sqlite_connection(self):
         """Get SQLite connection"""
-        conn = sqlite3.connect(SQLITE_DATABASE_PATH)
+        # Pooled connections are handed to one thread at a time
+        conn = sqlite3.connect(SQLITE_DATABASE_PATH, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         conn.execute('PRAGMA busy_timeout = 30000')
+        self._apply_profile(conn)
         return conn
     
+    def _apply_profile(self, conn):
+        """Apply the active performance profile PRAGMAs to a new connection"""
+        for pragma in PRAGMA_ORDER:
+            if pragma in self.profile:
+                conn.execute(f"PRAGMA {pragma} = {self.profile[pragma]}")
+    
+    def get_profile_info(self):
+        """Describe the active performance profile"""
+        return {
+            'name': self.profile_name,
+            'pragmas': dict(self.profile)
+        }
+    
+    def get_data_version(self, connection):
+        """Return the current data version (bumped by every write)"""
+        row = connection.execute('SELECT version FROM data_version WHERE id = 1').fetchone()
+        return row[0] if row else 0
+    
+    def bump_data_version(self, connection):
+        """Increment the data version inside the caller's transaction and return it"""
+        if SUPPORTS_RETURNING:
+            row = connection.execute(
+                'UPDATE data_version SET version = version + 1 WHERE id = 1 RETURNING version'
+            ).fetchone()
+            return row[0] if row else 0
+        connection.execute('UPDATE data_version SET version = version + 1 WHERE id = 1')
+        return self.get_data_version(connection)
+    
     def execute_query(self, connection, query, params=None, fetch_one=False, fetch_all=False):
         """Execute query with proper error handling"""
         cursor = None
@@ -67,6 +291,29 @@ class DatabaseManager:
         finally:
             if cursor:
                 cursor.close()
+    
+    def iter_query(self, connection, query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Execute a query and yield its rows as lists of at most chunk_size dicts.
+        Rows are read from the cursor with fetchmany, so the result set is never
+        held in memory at once; the cursor closes when the generator finishes
+        or is closed.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(max(chunk_size, 1))
+                if not rows:
+                    break
+                yield [dict(zip(row.keys(), row)) if isinstance(row, sqlite3.Row) else dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Erro ao executar query: {str(e)}")
+            logger.error(f"Query: {query}")
+            logger.error(f"Params: {params}")
+            raise e
+        finally:
+            cursor.close()
 
 # Global database manager instance
 db_manager = DatabaseManager()
\ No newline at end of file
@@ -0,0 +1,265 @@
+import json
+import time
+import logging
+from collections import namedtuple
+from aulas_storage import Bitset
+from config import (
+    EVENTS_LOG_SIZE, EVENTS_POLL_INTERVAL, EVENTS_HEARTBEAT, EVENTS_MAX_DURATION, EVENTS_TOMBSTONE_RETENTION
+)
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+CURSO_CRIADO = 'curso_criado'
+CURSO_ATUALIZADO = 'curso_atualizado'
+CURSO_REMOVIDO = 'curso_removido'
+AULAS_ATUALIZADAS = 'aulas_atualizadas'
+
+# SSE comment: keeps proxies from closing an idle stream
+KEEP_ALIVE = ': keep-alive\n\n'
+
+# One change made by a write: lesson deltas are tuples of (start, end) ranges
+# holding the final state of those lessons, so replaying them is idempotent
+Mudanca = namedtuple('Mudanca', ['curso_id', 'tipo', 'marcadas', 'desmarcadas'], defaults=((), ()))
+
+def para_intervalos(numeros):
+    """Lesson numbers -> hashable tuple of (start, end) ranges"""
+    return tuple(tuple(par) for par in Bitset.from_numbers(numeros).ranges())
+
+class EstadoAulas:
+    """
+    Net lesson delta of a course across several changes: the last state
+    written for each lesson wins.
+    """
+    def __init__(self):
+        self.marcadas = Bitset()
+        self.desmarcadas = Bitset()
+    
+    def aplicar(self, marcadas, desmarcadas):
+        for inicio, fim in marcadas:
+            mascara = Bitset.range_mask(inicio, fim)
+            self.marcadas.value |= mascara
+            self.desmarcadas.value &= ~mascara
+        for inicio, fim in desmarcadas:
+            mascara = Bitset.range_mask(inicio, fim)
+            self.desmarcadas.value |= mascara
+            self.marcadas.value &= ~mascara
+    
+    def vazio(self):
+        return not self.marcadas.value and not self.desmarcadas.value
+
+class EventFeed:
+    """
+    Change journal, published as Server-Sent Events and as delta sync.
+    
+    Writes append one row per changed course to the eventos table, in the write
+    transaction, so every worker process sees the same ordered feed. Streams poll
+    PRAGMA data_version on a dedicated connection (cheap; it only changes after
+    another connection commits) and then read the new rows. The row id is the SSE
+    event id, so a client resumes exactly where it stopped via Last-Event-ID.
+    
+    Only the last log_size rows are kept verbatim. Older rows are folded into
+    eventos_compactados, one row per course with its latest kind and net lesson
+    delta, so changes_since() can serve any version without a full resync.
+    Existing courses keep one row each; a removed course keeps its tombstone for
+    tombstone_retention data versions. Pruning a tombstone moves horizon() up,
+    and a client syncing from an older version must reload instead.
+    """
+    def __init__(self, connection_factory, log_size=EVENTS_LOG_SIZE, poll_interval=EVENTS_POLL_INTERVAL,
+                 heartbeat=EVENTS_HEARTBEAT, max_duration=EVENTS_MAX_DURATION,
+                 tombstone_retention=EVENTS_TOMBSTONE_RETENTION):
+        self.log_size = log_size
+        self.tombstone_retention = tombstone_retention
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_duration = max_duration
+        self._factory = connection_factory
+    
+    def record(self, connection, version, mudancas):
+        """Append events for Mudanca changes (call inside the write transaction)"""
+        if not mudancas:
+            return
+        curso_ids = list(dict.fromkeys(mudanca.curso_id for mudanca in mudancas))
+        placeholders = ', '.join('?' for _ in curso_ids)
+        contagens = dict(connection.execute(
+            f'SELECT id, aulas_concluidas_count FROM cursos WHERE id IN ({placeholders})',
+            curso_ids
+        ).fetchall())
+        
+        connection.executemany(
+            '''INSERT INTO eventos (version, curso_id, tipo, aulas_concluidas, marcadas, desmarcadas)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            [
+                (
+                    version, mudanca.curso_id, mudanca.tipo, contagens.get(mudanca.curso_id),
+                    json.dumps(mudanca.marcadas) if mudanca.marcadas else None,
+                    json.dumps(mudanca.desmarcadas) if mudanca.desmarcadas else None
+                )
+                for mudanca in mudancas
+            ]
+        )
+        ultimo = connection.execute('SELECT MAX(id) FROM eventos').fetchone()[0]
+        self._compact(connection, ultimo - self.log_size, version)
+    
+    def horizon(self, connection):
+        """Oldest `since` that changes_since() still answers exactly"""
+        row = connection.execute('SELECT version FROM eventos_horizonte WHERE id = 1').fetchone()
+        return row[0] if row else 0
+    
+    def changes_since(self, connection, since):
+        """
+        Net changes per course after data version `since`:
+        {curso_id: (tipo, EstadoAulas)}, where tipo is the course's latest kind.
+        Removals before horizon() may be missing; check it first.
+        """
+        alteracoes = {}
+        
+        def aplicar(curso_id, tipo, marcadas, desmarcadas):
+            _, estado = alteracoes.get(curso_id, (None, EstadoAulas()))
+            estado.aplicar(json.loads(marcadas or '[]'), json.loads(desmarcadas or '[]'))
+            alteracoes[curso_id] = (tipo, estado)
+        
+        # Folded history first (it predates every verbatim row)
+        for row in connection.execute(
+            '''SELECT curso_id, tipo, marcadas, desmarcadas FROM eventos_compactados
+               WHERE version > ? ORDER BY version''',
+            (since,)
+        ).fetchall():
+            aplicar(*row)
+        
+        for row in connection.execute(
+            'SELECT curso_id, tipo, marcadas, desmarcadas FROM eventos WHERE version > ? ORDER BY id',
+            (since,)
+        ).fetchall():
+            aplicar(*row)
+        return alteracoes
+    
+    def stream(self, last_event_id=None):
+        """
+        Generator of SSE frames. Starts after last_event_id, or at the current end
+        of the feed when it is None. Ends after max_duration; the client's
+        EventSource reconnects and resumes with Last-Event-ID.
+        """
+        connection = self._factory()
+        try:
+            last_event_id, frames = self.prelude(connection, last_event_id)
+            yield from frames
+            
+            inicio = time.monotonic()
+            ultimo_envio = inicio
+            pragma_version = None
+            while time.monotonic() - inicio < self.max_duration:
+                atual = connection.execute('PRAGMA data_version').fetchone()[0]
+                if atual != pragma_version:
+                    pragma_version = atual
+                    for last_event_id, frame in self.frames_after(connection, last_event_id):
+                        yield frame
+                        ultimo_envio = time.monotonic()
+                
+                if time.monotonic() - ultimo_envio >= self.heartbeat:
+                    yield KEEP_ALIVE
+                    ultimo_envio = time.monotonic()
+                time.sleep(self.poll_interval)
+        finally:
+            connection.close()
+    
+    def prelude(self, connection, last_event_id):
+        """
+        Opening frames of a stream and the event id it continues from:
+        (last_event_id, frames). Shared by the WSGI and ASGI servers.
+        """
+        primeiro, ultimo = self._bounds(connection)
+        frames = [f'retry: {int(self.poll_interval * 2000)}\n\n']
+        
+        if last_event_id is None or last_event_id > ultimo:
+            last_event_id = ultimo
+        elif primeiro is not None and last_event_id < primeiro - 1:
+            # The events the client missed were compacted: it must refetch
+            frames.append(self._frame(ultimo, 'reset', {'version': self._version(connection)}))
+            last_event_id = ultimo
+        return last_event_id, frames
+    
+    def frames_after(self, connection, last_event_id):
+        """(event id, SSE frame) for every event after last_event_id, in order"""
+        return [
+            (evento['id'], self._frame(evento['id'], evento['tipo'], {
+                'curso_id': evento['curso_id'],
+                'tipo': evento['tipo'],
+                'aulas_concluidas': evento['aulas_concluidas'],
+                'version': evento['version']
+            }))
+            for evento in self._read_since(connection, last_event_id)
+        ]
+    
+    def _compact(self, connection, ate_id, version):
+        """
+        Fold verbatim rows with id <= ate_id into eventos_compactados, then drop
+        the tombstones that are older than tombstone_retention versions
+        """
+        rows = connection.execute(
+            '''SELECT version, curso_id, tipo, marcadas, desmarcadas FROM eventos
+               WHERE id <= ? ORDER BY id''',
+            (ate_id,)
+        ).fetchall()
+        if not rows:
+            return
+        
+        resumos = {}
+        for version, curso_id, tipo, marcadas, desmarcadas in rows:
+            if curso_id not in resumos:
+                anterior = connection.execute(
+                    'SELECT marcadas, desmarcadas FROM eventos_compactados WHERE curso_id = ?',
+                    (curso_id,)
+                ).fetchone()
+                estado = EstadoAulas()
+                if anterior:
+                    estado.aplicar(json.loads(anterior[0] or '[]'), json.loads(anterior[1] or '[]'))
+                resumos[curso_id] = [version, tipo, estado]
+            resumo = resumos[curso_id]
+            resumo[0], resumo[1] = version, tipo
+            resumo[2].aplicar(json.loads(marcadas or '[]'), json.loads(desmarcadas or '[]'))
+        
+        registros = []
+        for curso_id, (version, tipo, estado) in resumos.items():
+            if tipo == CURSO_REMOVIDO or estado.vazio():
+                # A removed course only needs its tombstone
+                marcadas = desmarcadas = None
+            else:
+                marcadas = json.dumps(estado.marcadas.ranges())
+                desmarcadas = json.dumps(estado.desmarcadas.ranges())
+            registros.append((curso_id, version, tipo, marcadas, desmarcadas))
+        connection.executemany(
+            '''INSERT OR REPLACE INTO eventos_compactados (curso_id, version, tipo, marcadas, desmarcadas)
+               VALUES (?, ?, ?, ?, ?)''',
+            registros
+        )
+        connection.execute('DELETE FROM eventos WHERE id <= ?', (ate_id,))
+        
+        limite = version - self.tombstone_retention
+        if limite > 0:
+            podados = connection.execute(
+                'DELETE FROM eventos_compactados WHERE tipo = ? AND version <= ?',
+                (CURSO_REMOVIDO, limite)
+            ).rowcount
+            if podados:
+                connection.execute(
+                    'UPDATE eventos_horizonte SET version = MAX(version, ?) WHERE id = 1',
+                    (limite,)
+                )
+    
+    def _bounds(self, connection):
+        row = connection.execute('SELECT MIN(id), MAX(id) FROM eventos').fetchone()
+        return row[0], row[1] or 0
+    
+    def _version(self, connection):
+        row = connection.execute('SELECT version FROM data_version WHERE id = 1').fetchone()
+        return row[0] if row else 0
+    
+    def _read_since(self, connection, last_event_id):
+        return connection.execute(
+            'SELECT id, version, curso_id, tipo, aulas_concluidas FROM eventos WHERE id > ? ORDER BY id',
+            (last_event_id,)
+        ).fetchall()
+    
+    def _frame(self, event_id, tipo, dados):
+        return f'id: {event_id}\nevent: {tipo}\ndata: {json.dumps(dados, separators=(",", ":"))}\n\n'
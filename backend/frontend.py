@@ -0,0 +1,93 @@
+"""
+Same-origin serving of the built frontend (SERVE_FRONTEND=1).
+
+    python frontend.py [dist_path]   # write .gz/.br next to the built files
+
+With the frontend and the API on one origin the browser makes no CORS
+preflight. Hashed build assets (dist/assets) are immutable and cached for a
+year; index.html is revalidated on every load so a new build is picked up.
+"""
+import os
+import sys
+import logging
+import mimetypes
+from flask import abort, request, send_file
+from werkzeug.utils import safe_join
+from compression import compressor, is_compressible, negotiate, ENCODINGS
+from config import FRONTEND_DIST, COMPRESSION_MIN_SIZE
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = 'assets'  # Vite output with content hashes in the file names
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+EXTENSOES = {'br': '.br', 'gzip': '.gz'}
+
+def register_frontend(app, dist_path=FRONTEND_DIST):
+    """Serve dist_path at / with history-mode fallback to index.html"""
+    dist_path = os.path.abspath(dist_path)
+    if not os.path.isfile(os.path.join(dist_path, 'index.html')):
+        logger.warning(f"Frontend não encontrado em {dist_path}; execute npm run build")
+    
+    @app.route('/', defaults={'caminho': ''})
+    @app.route('/<path:caminho>')
+    def frontend(caminho):
+        # Unknown API routes keep their JSON 404
+        if caminho == 'api' or caminho.startswith('api/'):
+            abort(404)
+        
+        arquivo = safe_join(dist_path, caminho) if caminho else None
+        if arquivo is None or not os.path.isfile(arquivo):
+            if caminho.startswith(ASSETS_DIR + '/'):
+                abort(404)
+            # Client-side route (vue-router history mode)
+            arquivo = os.path.join(dist_path, 'index.html')
+        return _send(arquivo, caminho.startswith(ASSETS_DIR + '/'))
+
+def _send(arquivo, imutavel):
+    mimetype = mimetypes.guess_type(arquivo)[0] or 'application/octet-stream'
+    disponiveis = [encoding for encoding in ENCODINGS if os.path.isfile(arquivo + EXTENSOES[encoding])]
+    encoding = negotiate(request.accept_encodings, disponiveis)
+    
+    # Each file variant has its own ETag (size and mtime), so encodings never mix
+    response = send_file(arquivo + EXTENSOES[encoding] if encoding else arquivo, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if is_compressible(mimetype):
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = CACHE_IMUTAVEL if imutavel else 'no-cache'
+    return response
+
+def precompress(dist_path=FRONTEND_DIST, min_size=COMPRESSION_MIN_SIZE):
+    """
+    Write a maximally compressed .gz (and .br) next to every compressible file
+    of at least min_size bytes, skipping variants newer than their source.
+    Returns the number of files written.
+    """
+    escritos = 0
+    for raiz, _, arquivos in os.walk(dist_path):
+        for nome in arquivos:
+            if nome.endswith(tuple(EXTENSOES.values())):
+                continue
+            origem = os.path.join(raiz, nome)
+            if not is_compressible(mimetypes.guess_type(origem)[0]) or os.path.getsize(origem) < min_size:
+                continue
+            
+            with open(origem, 'rb') as f:
+                dados = None
+                for encoding in ENCODINGS:
+                    destino = origem + EXTENSOES[encoding]
+                    if os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(origem):
+                        continue
+                    if dados is None:
+                        dados = f.read()
+                    temporario = destino + '.tmp'
+                    with open(temporario, 'wb') as saida:
+                        saida.write(compressor.compress(dados, encoding, maximo=True))
+                    # Atomic: workers never serve a half-written file
+                    os.replace(temporario, destino)
+                    escritos += 1
+    return escritos
+
+if __name__ == '__main__':
+    destino = sys.argv[1] if len(sys.argv) > 1 else FRONTEND_DIST
+    print(f"{precompress(destino)} arquivos comprimidos em {os.path.abspath(destino)}")
@@ -0,0 +1,57 @@
+"""
+Gunicorn configuration for the WebCurso API
+===========================================
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is preloaded in the master and the database is initialized there once,
+before the workers fork. SQLite takes one writer at a time, so adding processes
+does not add write throughput: each worker batches its writes through its own
+write queue (group commit) and serves reads from WEB_THREADS threads, each with
+a pooled connection. Keep WEB_THREADS at most DB_POOL_SIZE, and remember that
+every open /api/events stream holds one thread.
+
+Graceful reload (the master is PID 1 in the container):
+    kill -HUP <master>   re-reads this file and replaces the workers one by one;
+                         with preload_app the application code is kept
+    kill -USR2 <master>  starts a new master with the new code, then
+    kill -QUIT <old>     lets the old master finish its requests and exit
+"""
+from config import (
+    WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT,
+    WEB_GRACEFUL_TIMEOUT, WEB_KEEPALIVE, WEB_MAX_REQUESTS, SERVE_FRONTEND
+)
+
+bind = WEB_BIND
+workers = WEB_WORKERS
+worker_class = 'gthread'
+threads = WEB_THREADS
+preload_app = True
+
+timeout = WEB_TIMEOUT
+graceful_timeout = WEB_GRACEFUL_TIMEOUT
+keepalive = WEB_KEEPALIVE
+max_requests = WEB_MAX_REQUESTS
+max_requests_jitter = WEB_MAX_REQUESTS // 10
+
+accesslog = '-'
+errorlog = '-'
+
+def on_starting(server):
+    """Runs once in the master, before any worker is forked"""
+    try:
+        from init_db import init_database
+        init_database()
+        server.log.info("Database initialized successfully")
+    except Exception as e:
+        server.log.error(f"Failed to initialize database: {str(e)}")
+    
+    if SERVE_FRONTEND:
+        # Static files are compressed once here, not on every request
+        from frontend import precompress
+        server.log.info(f"Precompressed {precompress()} frontend files")
+
+def post_fork(server, worker):
+    # Pool, cache coherence, write queue and event streams open their own
+    # connections and threads lazily in each worker (they check the pid)
+    server.log.info(f"Worker {worker.pid} ready ({threads} threads)")
@@ -1,17 +1,75 @@
 import sqlite3
 import os
+import sys
+from aulas_storage import Bitset, AulasStore, LAYOUTS
 
-def init_database():
+# Colunas calculadas (GENERATED ALWAYS) exigem SQLite 3.31
+SQLITE_VERSAO_MINIMA = (3, 31, 0)
+
+# Colunas virtuais derivadas de total_aulas, aulas_concluidas_count, horas e minutos
+COLUNAS_CALCULADAS = [
+    ('progresso_ordem', '''REAL GENERATED ALWAYS AS (
+        CASE WHEN total_aulas > 0
+             THEN CAST(aulas_concluidas_count AS REAL) / total_aulas
+             ELSE 0 END
+    ) VIRTUAL'''),
+    ('tempo_restante_minutos', '''REAL GENERATED ALWAYS AS (
+        CASE WHEN total_aulas > 0
+             THEN MAX(0, total_aulas - aulas_concluidas_count)
+                  * ((COALESCE(horas, 0) * 60 + COALESCE(minutos, 0)) * 1.0 / total_aulas)
+             ELSE 0 END
+    ) VIRTUAL'''),
+    ('status', '''TEXT GENERATED ALWAYS AS (
+        CASE WHEN aulas_concluidas_count <= 0 THEN 'nao_iniciado'
+             WHEN aulas_concluidas_count >= total_aulas THEN 'concluido'
+             ELSE 'em_andamento' END
+    ) VIRTUAL''')
+]
+
+def rebuild_estatisticas(cursor):
+    """
+    Recalcula do zero os contadores materializados (aulas_concluidas_count e
+    a tabela estatisticas). Use para reparo caso fiquem inconsistentes.
+    """
+    cursor.execute('''
+        UPDATE cursos SET aulas_concluidas_count = (
+            SELECT COUNT(*) FROM aulas_concluidas WHERE aulas_concluidas.curso_id = cursos.id
+        )
+    ''')
+    
+    # Cursos no layout bitmap: contagem de bits feita em Python
+    cursor.execute('SELECT curso_id, bitmap FROM aulas_bitmap')
+    for curso_id, bitmap in cursor.fetchall():
+        cursor.execute(
+            'UPDATE cursos SET aulas_concluidas_count = ? WHERE id = ?',
+            (Bitset.from_blob(bitmap).popcount(), curso_id)
+        )
+    
+    cursor.execute('''
+        UPDATE estatisticas SET
+            total_cursos = (SELECT COUNT(*) FROM cursos),
+            total_aulas_concluidas = (SELECT COALESCE(SUM(aulas_concluidas_count), 0) FROM cursos),
+            total_aulas_disponiveis = (SELECT COALESCE(SUM(total_aulas), 0) FROM cursos)
+        WHERE id = 1
+    ''')
+
+def init_database(db_path=None):
     """
     Inicializa o banco de dados SQLite criando as tabelas necessárias.
     """
+    if sqlite3.sqlite_version_info < SQLITE_VERSAO_MINIMA:
+        raise RuntimeError(
+            f"SQLite {sqlite3.sqlite_version} não é suportado: é necessária a versão "
+            f"{'.'.join(map(str, SQLITE_VERSAO_MINIMA))} ou superior"
+        )
+    
     # Garante que o diretório instance existe
     instance_path = os.path.join(os.path.dirname(__file__), 'instance')
     if not os.path.exists(instance_path):
         os.makedirs(instance_path)
     
     # Caminho do banco de dados
-    db_path = os.path.join(instance_path, 'database.sqlite')
+    db_path = db_path or os.path.join(instance_path, 'database.sqlite')
     
     # Conecta ao banco de dados (cria o arquivo se não existir)
     conn = sqlite3.connect(db_path)
@@ -27,6 +85,7 @@ def init_database():
             anotacoes TEXT,
             horas INTEGER DEFAULT 0,
             minutos INTEGER DEFAULT 0,
+            aulas_concluidas_count INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -44,6 +103,79 @@ def init_database():
         )
     ''')
     
+    # Versão dos dados: incrementada a cada escrita (usada nos ETags)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+    
+    # Aulas concluídas no layout bitmap (um BLOB por curso, ver aulas_storage.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS aulas_bitmap (
+            curso_id INTEGER PRIMARY KEY,
+            bitmap BLOB NOT NULL,
+            FOREIGN KEY (curso_id) REFERENCES cursos (id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Estatísticas globais materializadas (uma linha, mantida por triggers)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estatisticas (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_cursos INTEGER NOT NULL DEFAULT 0,
+            total_aulas_concluidas INTEGER NOT NULL DEFAULT 0,
+            total_aulas_disponiveis INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO estatisticas (id) VALUES (1)')
+    estatisticas_criadas = cursor.rowcount == 1
+    
+    # Registro de invalidações do cache, lido pelos demais processos (workers)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            version INTEGER PRIMARY KEY,
+            tags TEXT NOT NULL
+        )
+    ''')
+    
+    # Diário de mudanças (/api/events e /api/changes): uma linha por curso
+    # alterado em cada escrita; marcadas/desmarcadas são intervalos em JSON
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version INTEGER NOT NULL,
+            curso_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            aulas_concluidas INTEGER,
+            marcadas TEXT,
+            desmarcadas TEXT
+        )
+    ''')
+    
+    # Linhas antigas do diário, compactadas em uma linha por curso
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos_compactados (
+            curso_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            marcadas TEXT,
+            desmarcadas TEXT
+        )
+    ''')
+    
+    # Versão até a qual os cursos removidos já saíram de eventos_compactados:
+    # /api/changes com since anterior a ela pede uma recarga completa
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos_horizonte (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO eventos_horizonte (id, version) VALUES (1, 0)')
+    
     # Adicionar colunas de horas e minutos se não existirem (migração)
     try:
         cursor.execute('ALTER TABLE cursos ADD COLUMN horas INTEGER DEFAULT 0')
@@ -57,6 +189,111 @@ def init_database():
     except sqlite3.OperationalError:
         pass  # Coluna já existe
     
+    # Contador desnormalizado de aulas concluídas (migração + preenchimento inicial)
+    try:
+        cursor.execute('ALTER TABLE cursos ADD COLUMN aulas_concluidas_count INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('''
+            UPDATE cursos SET aulas_concluidas_count = (
+                SELECT COUNT(*) FROM aulas_concluidas WHERE aulas_concluidas.curso_id = cursos.id
+            )
+        ''')
+        print("Coluna 'aulas_concluidas_count' adicionada e preenchida com sucesso")
+    except sqlite3.OperationalError:
+        pass  # Coluna já existe
+    
+    # Colunas calculadas (virtuais) usadas para ordenação e filtros da listagem
+    for coluna, definicao in COLUNAS_CALCULADAS:
+        try:
+            cursor.execute(f'ALTER TABLE cursos ADD COLUMN {coluna} {definicao}')
+            print(f"Coluna calculada '{coluna}' adicionada com sucesso")
+        except sqlite3.OperationalError:
+            pass  # Coluna já existe
+    
+    # Triggers que mantêm aulas_concluidas_count exato
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_aulas_concluidas_insert
+        AFTER INSERT ON aulas_concluidas
+        BEGIN
+            UPDATE cursos SET aulas_concluidas_count = aulas_concluidas_count + 1
+            WHERE id = NEW.curso_id;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_aulas_concluidas_delete
+        AFTER DELETE ON aulas_concluidas
+        BEGIN
+            UPDATE cursos SET aulas_concluidas_count = aulas_concluidas_count - 1
+            WHERE id = OLD.curso_id;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_aulas_concluidas_update
+        AFTER UPDATE OF curso_id ON aulas_concluidas
+        WHEN OLD.curso_id <> NEW.curso_id
+        BEGIN
+            UPDATE cursos SET aulas_concluidas_count = aulas_concluidas_count - 1
+            WHERE id = OLD.curso_id;
+            UPDATE cursos SET aulas_concluidas_count = aulas_concluidas_count + 1
+            WHERE id = NEW.curso_id;
+        END
+    ''')
+    
+    # Triggers que mantêm a tabela estatisticas
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estatisticas_curso_insert
+        AFTER INSERT ON cursos
+        BEGIN
+            UPDATE estatisticas
+            SET total_cursos = total_cursos + 1,
+                total_aulas_disponiveis = total_aulas_disponiveis + NEW.total_aulas
+            WHERE id = 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estatisticas_curso_delete
+        AFTER DELETE ON cursos
+        BEGIN
+            UPDATE estatisticas
+            SET total_cursos = total_cursos - 1,
+                total_aulas_disponiveis = total_aulas_disponiveis - OLD.total_aulas
+            WHERE id = 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estatisticas_curso_update
+        AFTER UPDATE OF total_aulas ON cursos
+        WHEN OLD.total_aulas <> NEW.total_aulas
+        BEGIN
+            UPDATE estatisticas
+            SET total_aulas_disponiveis = total_aulas_disponiveis + NEW.total_aulas - OLD.total_aulas
+            WHERE id = 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estatisticas_aula_insert
+        AFTER INSERT ON aulas_concluidas
+        BEGIN
+            UPDATE estatisticas SET total_aulas_concluidas = total_aulas_concluidas + 1 WHERE id = 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estatisticas_aula_delete
+        AFTER DELETE ON aulas_concluidas
+        BEGIN
+            UPDATE estatisticas SET total_aulas_concluidas = total_aulas_concluidas - 1 WHERE id = 1;
+        END
+    ''')
+    
+    if estatisticas_criadas:
+        rebuild_estatisticas(cursor)
+        print("Tabela 'estatisticas' criada e preenchida com sucesso")
+    
     # Criar índices para melhor performance
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_aulas_concluidas_curso_id 
@@ -68,12 +305,22 @@ def init_database():
         ON aulas_concluidas (numero_aula)
     ''')
     
+    # Índices da listagem de cursos (paginação por cursor e ordenação)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cursos_created_at ON cursos (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cursos_updated_at ON cursos (updated_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cursos_titulo ON cursos (titulo COLLATE NOCASE, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cursos_progresso ON cursos (progresso_ordem, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cursos_tempo_restante ON cursos (tempo_restante_minutos, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cursos_status ON cursos (status, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_eventos_version ON eventos (version)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_eventos_compactados_version ON eventos_compactados (version)')
+    
     # Commit das mudanças
     conn.commit()
     
     print(f"Banco de dados inicializado em: {db_path}")
     print("Tabelas criadas:")
-    print("- cursos (id, titulo, link, total_aulas, anotacoes, created_at, updated_at)")
+    print("- cursos (id, titulo, link, total_aulas, anotacoes, horas, minutos, aulas_concluidas_count, created_at, updated_at)")
     print("- aulas_concluidas (id, curso_id, numero_aula, created_at)")
     
     # Inserir alguns dados de exemplo (opcional)
@@ -101,5 +348,43 @@ def init_database():
     
     conn.close()
 
+def rebuild_database_counters(db_path=None):
+    """
+    Reparo manual: python init_db.py --rebuild-stats
+    """
+    db_path = db_path or os.path.join(os.path.dirname(__file__), 'instance', 'database.sqlite')
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    rebuild_estatisticas(cursor)
+    # Mesma transação: os ETags mudam, e os workers em execução veem a versão sem
+    # registro em cache_invalidations e descartam todo o cache de respostas
+    cursor.execute('UPDATE data_version SET version = version + 1 WHERE id = 1')
+    conn.commit()
+    conn.close()
+    print(f"Contadores e estatísticas recalculados em: {db_path}")
+
+def migrate_storage(destino, db_path=None):
+    """
+    Migração online do armazenamento de aulas concluídas:
+    python init_db.py --migrate-storage bitmap|rows
+    """
+    db_path = db_path or os.path.join(os.path.dirname(__file__), 'instance', 'database.sqlite')
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        migrados = AulasStore(destino).migrar_todos(conn, destino)
+    finally:
+        conn.close()
+    print(f"{migrados} curso(s) convertido(s) para o layout '{destino}' em: {db_path}")
+
 if __name__ == '__main__':
-    init_database()
\ No newline at end of file
+    if '--rebuild-stats' in sys.argv:
+        rebuild_database_counters()
+    elif '--migrate-storage' in sys.argv:
+        indice = sys.argv.index('--migrate-storage') + 1
+        destino = sys.argv[indice] if indice < len(sys.argv) else None
+        if destino not in LAYOUTS:
+            print(f"Uso: python init_db.py --migrate-storage {'|'.join(LAYOUTS)}")
+            sys.exit(1)
+        migrate_storage(destino)
+    else:
+        init_database()
\ No newline at end of file
@@ -0,0 +1,299 @@
+import threading
+import time
+import math
+import logging
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from config import (
+    WRITE_QUEUE_ENABLED, WRITE_QUEUE_LINGER_MS, WRITE_QUEUE_MAX_BATCH,
+    WRITE_QUEUE_MAX_DEPTH, WRITE_QUEUE_DEADLINE
+)
+
+logger = logging.getLogger(__name__)
+
+class WriteRejected(Exception):
+    """
+    A write that was not admitted (queue full) or could not run before its
+    deadline (queue backlog or database lock). Nothing was written.
+    """
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def _is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error)
+    )
+
+class WriteQueue:
+    """
+    Single-writer group commit with admission control for database writes.
+    
+    Callers submit an operation(connection) that returns (result, changes), where
+    changes lists the Mudanca records (events.py) of what it modified, in order.
+    A writer thread takes the first pending operation, lingers a few milliseconds
+    for more, and runs them all in one transaction, each under its own SAVEPOINT
+    so a failing operation does not undo the others. before_commit(connection,
+    changes) runs once per group with every change made by it, and then the
+    group pays a single commit. Each caller receives its own result (or exception).
+    
+    Admission: at most max_depth writes wait at a time, and a write that has not
+    started within `deadline` seconds is withdrawn. Both cases raise WriteRejected,
+    so request threads are never parked on the SQLite lock for long.
+    
+    With enabled=False operations run in the caller's thread as groups of one, on
+    a connection from direct_connection_factory (defaults to connection_factory).
+    """
+    def __init__(self, connection_factory, before_commit=None, linger_ms=WRITE_QUEUE_LINGER_MS,
+                 max_batch=WRITE_QUEUE_MAX_BATCH, enabled=WRITE_QUEUE_ENABLED,
+                 direct_connection_factory=None, max_depth=WRITE_QUEUE_MAX_DEPTH,
+                 deadline=WRITE_QUEUE_DEADLINE):
+        self.linger = max(linger_ms, 0) / 1000.0
+        self.max_batch = max(max_batch, 1)
+        self.max_depth = max(max_depth, 1)
+        self.deadline = max(deadline, 0.001)
+        self.enabled = enabled
+        self._factory = connection_factory
+        self._direct_factory = direct_connection_factory or connection_factory
+        self._before_commit = before_commit
+        self._pending = deque()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._connection = None
+        self._pid = None
+        self._group_seconds = 0.0  # Média móvel da duração de um grupo
+        self._running_since = []  # Início de cada grupo em execução (vários no modo direto)
+        self._wait_total = 0.0
+        self._stats = {
+            'operations': 0,
+            'groups': 0,
+            'failed_groups': 0,
+            'largest_group': 0,
+            'rejected_full': 0,
+            'rejected_deadline': 0,
+            'rejected_locked': 0,
+            'wait_ms_max': 0.0
+        }
+    
+    def submit(self, operation):
+        """Run operation(connection) in the next group commit and return its result"""
+        if not self.enabled:
+            return self._submit_direct(operation)
+        
+        future = Future()
+        with self._condition:
+            self._ensure_thread()
+            if len(self._pending) >= self.max_depth:
+                self._stats['rejected_full'] += 1
+                raise WriteRejected('fila de escrita cheia', self._retry_after())
+            self._pending.append((operation, future, time.monotonic()))
+            self._condition.notify()
+        
+        try:
+            return future.result(timeout=self.deadline)
+        except FutureTimeout:
+            # Still queued: withdraw it. Already running: its group is short, wait for it.
+            if future.cancel():
+                with self._condition:
+                    self._stats['rejected_deadline'] += 1
+                    retry_after = self._retry_after()
+                raise WriteRejected('prazo de espera da escrita esgotado', retry_after)
+            return future.result()
+    
+    def stats(self):
+        with self._condition:
+            operations = self._stats['operations']
+            groups = self._stats['groups']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'pending': len(self._pending) if self.enabled else self._in_flight,
+                'max_depth': self.max_depth,
+                'deadline': self.deadline,
+                'wait_ms_avg': round(self._wait_total * 1000 / operations, 2) if operations else 0.0,
+                'average_group': round(operations / groups, 2) if groups else 0.0,
+                'linger_ms': self.linger * 1000,
+                'max_batch': self.max_batch
+            }
+    
+    def _submit_direct(self, operation):
+        with self._condition:
+            if self._in_flight >= self.max_depth:
+                self._stats['rejected_full'] += 1
+                raise WriteRejected('escritas simultâneas demais', self._retry_after())
+            self._in_flight += 1
+        
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            connection = self._direct_factory()
+            busy_timeout = connection.execute('PRAGMA busy_timeout').fetchone()[0]
+            connection.execute(f'PRAGMA busy_timeout = {int(self.deadline * 1000)}')
+            try:
+                self._run_group(connection, [(operation, future, time.monotonic())])
+            finally:
+                connection.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+                connection.close()
+        except Exception as e:
+            raise self._translate(e)
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+        return future.result()
+    
+    def _retry_after(self):
+        """Seconds until the current backlog is likely drained (call with the lock held)"""
+        backlog = len(self._pending) if self.enabled else self._in_flight
+        groups_ahead = backlog / self.max_batch + 1
+        # A group that is still running has taken at least its elapsed time, and while
+        # it stalls (a huge write, another process' lock) the groups behind it will too;
+        # the moving average alone only learns about the stall after it ends
+        group_seconds = self._group_seconds
+        if self._running_since:
+            group_seconds = max(group_seconds, time.monotonic() - min(self._running_since))
+        return max(1, math.ceil(groups_ahead * (group_seconds + self.linger)))
+    
+    def _translate(self, error):
+        # A lock held by another process past the deadline is overload, not a failure
+        if _is_lock_error(error):
+            with self._condition:
+                self._stats['rejected_locked'] += 1
+                return WriteRejected('banco de dados ocupado', self._retry_after())
+        return error
+    
+    def _ensure_thread(self):
+        # A writer thread does not survive fork(); start a fresh one per process
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        if self._pid != os.getpid():
+            # Whatever the parent had queued or opened belongs to the parent
+            self._connection = None
+            self._pending.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+    
+    def _next_group(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            
+            # Give concurrent callers a moment to join this group
+            deadline = time.monotonic() + self.linger
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            
+            group = []
+            while self._pending and len(group) < self.max_batch:
+                item = self._pending.popleft()
+                # Skip writes whose callers already gave up (deadline)
+                if item[1].set_running_or_notify_cancel():
+                    group.append(item)
+            return group
+    
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if not group:
+                continue
+            try:
+                if self._connection is None:
+                    self._connection = self._factory()
+                    # Never wait on another process' lock longer than callers wait for us
+                    self._connection.execute(f'PRAGMA busy_timeout = {int(self.deadline * 1000)}')
+                self._run_group(self._connection, group)
+            except Exception as e:
+                logger.error(f"Erro na fila de escrita: {str(e)}")
+                if not _is_lock_error(e):
+                    # The connection may be unusable; reopen it for the next group
+                    self._close_connection()
+                error = self._translate(e)
+                for _, future, _ in group:
+                    if not future.done():
+                        future.set_exception(error)
+    
+    def _run_group(self, connection, group):
+        started = time.monotonic()
+        with self._condition:
+            self._running_since.append(started)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            if len(group) == 1:
+                results, changes = self._run_single(connection, group[0][0])
+            else:
+                results, changes = self._run_isolated(connection, group)
+            
+            # A failed single operation has already rolled back
+            if connection.in_transaction:
+                if changes and self._before_commit is not None:
+                    self._before_commit(connection, changes)
+                connection.commit()
+        except Exception:
+            if connection.in_transaction:
+                connection.rollback()
+            with self._condition:
+                self._stats['failed_groups'] += 1
+            raise
+        finally:
+            with self._condition:
+                self._running_since.remove(started)
+        
+        finished = time.monotonic()
+        with self._condition:
+            self._stats['operations'] += len(group)
+            self._stats['groups'] += 1
+            self._stats['largest_group'] = max(self._stats['largest_group'], len(group))
+            for _, _, enqueued in group:
+                wait = started - enqueued
+                self._wait_total += wait
+                self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], round(wait * 1000, 2))
+            self._group_seconds = 0.8 * self._group_seconds + 0.2 * (finished - started)
+        
+        for (_, future, _), (ok, value) in zip(group, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+    
+    def _run_single(self, connection, operation):
+        # Nothing to isolate: a failure simply rolls back the transaction,
+        # which saves the SAVEPOINT/RELEASE round-trips
+        try:
+            result, changes = operation(connection)
+        except Exception as e:
+            connection.rollback()
+            return [(False, e)], []
+        return [(True, result)], list(changes)
+    
+    def _run_isolated(self, connection, group):
+        results = []
+        changes = []
+        for index, (operation, _, _) in enumerate(group):
+            savepoint = f'op_{index}'
+            connection.execute(f'SAVEPOINT {savepoint}')
+            try:
+                result, alteracoes = operation(connection)
+            except Exception as e:
+                connection.execute(f'ROLLBACK TO {savepoint}')
+                connection.execute(f'RELEASE {savepoint}')
+                results.append((False, e))
+                continue
+            connection.execute(f'RELEASE {savepoint}')
+            results.append((True, result))
+            changes.extend(alteracoes)
+        return results, changes
+    
+    def _close_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing the app does not touch the database, so it can be preloaded in a
+master process and forked. With gunicorn the schema is initialized once in the
+master (see gunicorn.conf.py); other WSGI servers should run python init_db.py
+before starting.
+"""
+from app import app
+
+# Name looked up by default by uWSGI and mod_wsgi
+application = app
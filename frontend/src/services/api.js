@@ -155,11 +155,14 @@ export const apiService = {
   // ===== AULAS =====
 
   // Marcar/desmarcar aula como concluída
-  async toggleAula(cursoId, numeroAula, concluida) {
+  // incluirLista: pede também aulas_concluidas_list na resposta
+  async toggleAula(cursoId, numeroAula, concluida, incluirLista = false) {
     try {
       const response = await api.post(`/cursos/${cursoId}/aula`, {
         numero_aula: numeroAula,
         concluida: concluida
+      }, {
+        params: incluirLista ? { include_list: true } : {}
       })
       return response.data
     } catch (error) {
@@ -0,0 +1,57 @@
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+# Os testes rodam sem servidor: importam o backend direto, com um banco temporário
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND)
+
+# Scripts manuais: falam com um servidor em localhost:5000 ou com o banco real
+collect_ignore = [
+    'final_test.py',
+    'test_api.py',
+    'test_batch_endpoint.py',
+    'test_batch_lessons.py',
+    'test_multiple_lessons.py',
+    'test_db.py'
+]
+
+_app = {}
+
+def preparar_app():
+    """
+    Importa o app uma única vez, apontando para uma cópia temporária do banco.
+    Retorna (módulo app, test client, caminho do banco).
+    """
+    if not _app:
+        tmp = tempfile.mkdtemp()
+        db_path = os.path.join(tmp, 'database.sqlite')
+        original = os.path.join(BACKEND, 'instance', 'database.sqlite')
+        if os.path.exists(original):
+            shutil.copy(original, db_path)
+        
+        # O app lê o caminho do banco ao ser importado
+        import config
+        import database
+        config.SQLITE_DATABASE_PATH = db_path
+        database.SQLITE_DATABASE_PATH = db_path
+        import init_db
+        init_db.init_database(db_path)
+        import app as app_module
+        _app['modulo'] = app_module
+        _app['db_path'] = db_path
+    return _app['modulo'], _app['modulo'].app.test_client(), _app['db_path']
+
+@pytest.fixture
+def app_module():
+    return preparar_app()[0]
+
+@pytest.fixture
+def client():
+    return preparar_app()[1]
+
+@pytest.fixture
+def db_path():
+    return preparar_app()[2]
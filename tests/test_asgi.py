@@ -0,0 +1,47 @@
+import asyncio
+import json
+import httpx
+from conftest import preparar_app
+
+def chamar(asgi_app, *args, **kwargs):
+    """Faz uma requisição direto no app ASGI, sem servidor"""
+    async def requisicao():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as cliente:
+            return await cliente.request(*args, **kwargs)
+    return asyncio.run(requisicao())
+
+def test_post_com_content_length():
+    """POST comum (com Content-Length) passa pela ponte ASGI → WSGI"""
+    preparar_app()
+    import asgi
+    response = chamar(asgi.app, 'POST', '/api/cursos', json={'titulo': 'ASGI', 'total_aulas': 5})
+    print(f"POST com Content-Length - Status: {response.status_code}")
+    assert response.status_code == 201
+    assert response.json()['data']['titulo'] == 'ASGI'
+
+def test_post_chunked_sem_content_length():
+    """POST chunked (sem Content-Length): o corpo chega inteiro ao Flask"""
+    preparar_app()
+    import asgi
+    corpo = json.dumps({'titulo': 'ASGI chunked', 'total_aulas': 8}).encode('utf-8')
+
+    async def partes():
+        for inicio in range(0, len(corpo), 7):
+            yield corpo[inicio:inicio + 7]
+
+    response = chamar(asgi.app, 'POST', '/api/cursos', content=partes(), headers={'Content-Type': 'application/json'})
+    print(f"POST chunked - Status: {response.status_code}, {response.json()}")
+    assert response.status_code == 201
+    curso = response.json()['data']
+    assert curso['titulo'] == 'ASGI chunked' and curso['total_aulas'] == 8
+
+    response = chamar(asgi.app, 'GET', f"/api/cursos/{curso['id']}")
+    assert response.status_code == 200
+    assert response.json()['data']['titulo'] == 'ASGI chunked'
+
+if __name__ == "__main__":
+    print("Testando a ponte ASGI (asgi.app)...")
+    test_post_com_content_length()
+    test_post_chunked_sem_content_length()
+    print("OK")
@@ -0,0 +1,210 @@
+import random
+import sqlite3
+from conftest import preparar_app
+from aulas_storage import Bitset, AulasStore, LAYOUT_ROWS, LAYOUT_BITMAP
+
+# Primeira e última aula de cada byte/palavra, onde um deslocamento errado aparece
+BORDAS = [1, 2, 7, 8, 9, 16, 17, 63, 64, 65, 128, 129, 1000]
+
+def ranges_esperados(numeros):
+    """Intervalos [inicio, fim] calculados do jeito simples, para comparar"""
+    ranges = []
+    for numero in sorted(numeros):
+        if ranges and ranges[-1][1] == numero - 1:
+            ranges[-1][1] = numero
+        else:
+            ranges.append([numero, numero])
+    return ranges
+
+def conferir(bitset, esperado):
+    assert bitset.numbers() == sorted(esperado)
+    assert bitset.popcount() == len(esperado)
+    assert bitset.ranges() == ranges_esperados(esperado)
+    assert Bitset.from_blob(bitset.to_blob()).value == bitset.value
+    for numero in BORDAS:
+        assert bitset.contains(numero) == (numero in esperado)
+
+def test_bitset_bits_de_borda():
+    """set/clear/contains nas aulas que caem na borda de um byte ou de uma palavra"""
+    bitset = Bitset()
+    conferir(bitset, set())
+    assert bitset.to_blob() == b''
+
+    for numero in BORDAS:
+        bitset.set(numero)
+        bitset.set(numero)  # Marcar de novo não muda nada
+    conferir(bitset, set(BORDAS))
+    assert len(bitset.to_blob()) == (1000 + 7) // 8
+
+    for numero in (1, 8, 64, 1000):
+        bitset.clear(numero)
+        bitset.clear(numero)
+    conferir(bitset, set(BORDAS) - {1, 8, 64, 1000})
+    # Limpar a última aula encolhe o BLOB
+    assert len(bitset.to_blob()) == (129 + 7) // 8
+    assert Bitset.from_numbers(BORDAS).numbers() == BORDAS
+
+def test_bitset_intervalos():
+    """set_range/clear_range, incluindo intervalos de uma aula e intervalos vazios"""
+    bitset = Bitset()
+    bitset.set_range(1, 8)
+    conferir(bitset, set(range(1, 9)))
+    bitset.set_range(9, 9)
+    bitset.set_range(63, 130)
+    conferir(bitset, set(range(1, 10)) | set(range(63, 131)))
+    bitset.clear_range(8, 64)
+    conferir(bitset, set(range(1, 8)) | set(range(65, 131)))
+    bitset.clear_range(130, 130)
+    bitset.set_range(5, 4)  # fim < inicio: nada muda
+    bitset.clear_range(10, 1)
+    conferir(bitset, set(range(1, 8)) | set(range(65, 130)))
+    assert Bitset.range_mask(3, 2) == 0
+    assert Bitset.range_mask(1, 1) == 1 and Bitset.range_mask(9, 9) == 1 << 8
+
+def test_bitset_contra_set():
+    """Sequência aleatória de operações comparada com um set do Python"""
+    aleatorio = random.Random(11)
+    bitset, esperado = Bitset(), set()
+    for _ in range(500):
+        inicio = aleatorio.randint(1, 300)
+        fim = min(inicio + aleatorio.randint(0, 40), 300)
+        operacao = aleatorio.choice(('set', 'clear', 'set_range', 'clear_range'))
+        if operacao == 'set':
+            bitset.set(inicio)
+            esperado.add(inicio)
+        elif operacao == 'clear':
+            bitset.clear(inicio)
+            esperado.discard(inicio)
+        elif operacao == 'set_range':
+            bitset.set_range(inicio, fim)
+            esperado.update(range(inicio, fim + 1))
+        else:
+            bitset.clear_range(inicio, fim)
+            esperado.difference_update(range(inicio, fim + 1))
+        conferir(bitset, esperado)
+
+def contadores(db_path):
+    """(aulas_concluidas_count de cada curso, linha de estatisticas)"""
+    conn = sqlite3.connect(db_path)
+    por_curso = dict(conn.execute('SELECT id, aulas_concluidas_count FROM cursos').fetchall())
+    estatisticas = conn.execute(
+        'SELECT total_cursos, total_aulas_concluidas, total_aulas_disponiveis FROM estatisticas WHERE id = 1'
+    ).fetchone()
+    conn.close()
+    return por_curso, estatisticas
+
+def ids_dos_cursos(conn):
+    return [curso_id for (curso_id,) in conn.execute('SELECT id FROM cursos ORDER BY id')]
+
+def test_migracao_ida_e_volta(client, db_path):
+    """rows → bitmap → rows mantém as aulas, aulas_concluidas_count e estatisticas exatos"""
+    cursos = {}
+    for total, marcadas in ((10, []), (64, [1, 8, 9, 63, 64]), (200, list(range(1, 130)) + [200])):
+        curso_id = client.post('/api/cursos', json={'titulo': f'Migração {total}', 'total_aulas': total}).get_json()['data']['id']
+        if marcadas:
+            aulas = [{'numero_aula': numero, 'concluida': True} for numero in marcadas]
+            assert client.post(f'/api/cursos/{curso_id}/aulas/batch', json={'aulas': aulas}).status_code == 200
+        cursos[curso_id] = marcadas
+
+    store = AulasStore(LAYOUT_ROWS)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        antes = {curso_id: store.listar(conn, curso_id) for curso_id in ids_dos_cursos(conn)}
+        contadores_antes = contadores(db_path)
+        for curso_id, marcadas in cursos.items():
+            assert antes[curso_id] == marcadas
+
+        for destino in (LAYOUT_BITMAP, LAYOUT_ROWS):
+            migrados = store.migrar_todos(conn, destino)
+            print(f"Migração para {destino}: {migrados} curso(s)")
+            assert migrados == len(antes)
+            assert all(store.layout(conn, curso_id) == destino for curso_id in antes)
+            assert {curso_id: store.listar(conn, curso_id) for curso_id in antes} == antes
+            assert contadores(db_path) == contadores_antes
+            linhas = conn.execute('SELECT COUNT(*) FROM aulas_concluidas').fetchone()[0]
+            assert linhas == (0 if destino == LAYOUT_BITMAP else sum(len(aulas) for aulas in antes.values()))
+            # Migrar de novo para o mesmo layout não faz nada
+            assert store.migrar_todos(conn, destino) == 0
+    finally:
+        conn.close()
+
+def curso_bitmap(app_module, client, db_path, total_aulas):
+    """Cria um curso e o converte para o layout bitmap antes de qualquer leitura pela API"""
+    curso_id = client.post('/api/cursos', json={'titulo': 'Bitmap', 'total_aulas': total_aulas}).get_json()['data']['id']
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        assert app_module.aulas_store.migrar_curso(conn, curso_id, LAYOUT_BITMAP)
+        conn.commit()
+    finally:
+        conn.close()
+    return curso_id
+
+def estado_do_curso(client, curso_id):
+    data = client.get(f'/api/cursos/{curso_id}').get_json()['data']
+    return data['aulas_concluidas'], data['aulas_concluidas_list']
+
+def test_endpoints_em_curso_bitmap(app_module, client, db_path):
+    """Aula única, lote e intervalos num curso bitmap, com os contadores conferidos a cada passo"""
+    curso_id = curso_bitmap(app_module, client, db_path, 130)
+    esperado = set()
+    _, estatisticas = contadores(db_path)
+
+    def conferir_curso():
+        total, lista = estado_do_curso(client, curso_id)
+        por_curso, atuais = contadores(db_path)
+        assert lista == sorted(esperado) and total == len(esperado)
+        assert por_curso[curso_id] == len(esperado)
+        assert atuais[1] == estatisticas[1] + len(esperado)
+        conn = sqlite3.connect(db_path)
+        assert app_module.aulas_store.layout(conn, curso_id) == LAYOUT_BITMAP
+        assert conn.execute('SELECT COUNT(*) FROM aulas_concluidas WHERE curso_id = ?', (curso_id,)).fetchone()[0] == 0
+        conn.close()
+
+    for numero in (1, 64, 65, 130):
+        response = client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': numero, 'concluida': True})
+        assert response.status_code == 200
+        esperado.add(numero)
+    client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 64, 'concluida': False})
+    esperado.discard(64)
+    conferir_curso()
+    assert client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 131, 'concluida': True}).status_code == 400
+
+    aulas = [{'numero_aula': numero, 'concluida': True} for numero in (8, 9, 10)]
+    aulas += [{'numero_aula': 1, 'concluida': False}, {'numero_aula': 10, 'concluida': False}]
+    delta = client.post(f'/api/cursos/{curso_id}/aulas/batch?delta=true', json={'aulas': aulas}).get_json()['data']
+    print(f"Lote no bitmap: {delta}")
+    assert delta['marcadas'] == [8, 9] and delta['desmarcadas'] == [1]
+    esperado.update((8, 9))
+    esperado.discard(1)
+    conferir_curso()
+
+    intervalos = [{'fim': 70, 'concluida': True}, {'inicio': 60, 'fim': 66, 'concluida': False}]
+    data = client.post(f'/api/cursos/{curso_id}/aulas/range', json={'intervalos': intervalos}).get_json()['data']
+    print(f"Intervalos no bitmap: {data['intervalos']}")
+    assert [intervalo['alteradas'] for intervalo in data['intervalos']] == [70 - 3, 7]
+    esperado.update(range(1, 71))
+    esperado.difference_update(range(60, 67))
+    conferir_curso()
+
+    # Entre cursos, misturando um curso bitmap e um curso rows
+    outro = client.post('/api/cursos', json={'titulo': 'Rows', 'total_aulas': 5}).get_json()['data']['id']
+    lote = {'cursos': [
+        {'curso_id': curso_id, 'aulas': [{'numero_aula': 130, 'concluida': False}, {'numero_aula': 100, 'concluida': True}]},
+        {'curso_id': outro, 'aulas': [{'numero_aula': 5, 'concluida': True}]}
+    ]}
+    resultado = client.post('/api/aulas/batch', json=lote).get_json()['data']['cursos']
+    assert resultado[0]['marcadas'] == [100] and resultado[0]['desmarcadas'] == [130]
+    esperado.add(100)
+    esperado.discard(130)
+    estatisticas = (estatisticas[0], estatisticas[1] + 1, estatisticas[2])
+    conferir_curso()
+
+if __name__ == "__main__":
+    print("Testando o armazenamento de aulas (Bitset, migração e layout bitmap)...")
+    test_bitset_bits_de_borda()
+    test_bitset_intervalos()
+    test_bitset_contra_set()
+    app_module, client, db_path = preparar_app()
+    test_migracao_ida_e_volta(client, db_path)
+    test_endpoints_em_curso_bitmap(app_module, client, db_path)
+    print("OK")
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import tempfile
+from conftest import preparar_app
+from cache import ResponseCache, CacheCoherence
+
+def test_invalidacao_por_tag():
+    """invalidate() só derruba as entradas das tags dadas e calculadas antes da versão"""
+    cache = ResponseCache(max_entries=10, ttl=60, enabled=True)
+    cache.set('lista', b'lista', ['cursos'], 5)
+    cache.set('curso 1', b'curso 1', ['curso:1', 'cursos'], 5)
+    cache.set('curso 2', b'curso 2', ['curso:2'], 5)
+    cache.set('curso 3', b'curso 3', ['curso:3'], 8)
+
+    cache.invalidate(['curso:1', 'curso:3'], 7)
+    print(f"Depois da invalidação: {cache.stats()}")
+    assert cache.get('curso 1') is None
+    # Calculada depois da escrita (versão 8): continua válida
+    assert cache.get('curso 3') == b'curso 3'
+    assert cache.get('curso 2') == b'curso 2'
+    assert cache.get('lista') == b'lista'
+    assert cache.stats()['invalidations'] == 1
+
+    cache.invalidate(['cursos'], 9)
+    assert cache.get('lista') is None and cache.get('curso 2') == b'curso 2'
+
+def test_set_antigo_recusado():
+    """Uma leitura que começou antes da escrita não grava o resultado depois dela"""
+    cache = ResponseCache(max_entries=10, ttl=60, enabled=True)
+    cache.invalidate(['curso:1'], 10)
+
+    assert cache.set('curso 1', b'antigo', ['curso:1', 'cursos'], 9) is False
+    assert cache.get('curso 1') is None
+    assert cache.stats()['rejected'] == 1
+
+    assert cache.set('curso 1', b'novo', ['curso:1', 'cursos'], 10) is True
+    assert cache.get('curso 1') == b'novo'
+    # Tags sem escrita registrada aceitam qualquer versão
+    assert cache.set('curso 2', b'curso 2', ['curso:2'], 1) is True
+
+def banco_compartilhado():
+    db_path = os.path.join(tempfile.mkdtemp(), 'coerencia.sqlite')
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('CREATE TABLE data_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL DEFAULT 0)')
+    conn.execute('INSERT INTO data_version (id, version) VALUES (1, 0)')
+    conn.execute('CREATE TABLE cache_invalidations (version INTEGER PRIMARY KEY, tags TEXT NOT NULL)')
+    conn.commit()
+    conn.close()
+    return db_path
+
+def processo(db_path, log_size=100):
+    """Cache e coerência de um worker, com conexões próprias ao mesmo arquivo"""
+    cache = ResponseCache(max_entries=10, ttl=60, enabled=True)
+    coerencia = CacheCoherence(cache, lambda: sqlite3.connect(db_path, check_same_thread=False), log_size=log_size)
+    coerencia.sync()
+    return cache, coerencia
+
+def escrever(db_path, coerencia, tags):
+    """Uma escrita de outro processo: versão nova e tags registradas na mesma transação"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('UPDATE data_version SET version = version + 1 WHERE id = 1')
+    version = conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+    coerencia.record(conn, tags, version)
+    conn.commit()
+    conn.close()
+    return version
+
+def test_coerencia_entre_processos():
+    """Uma escrita do processo A derruba só as entradas afetadas no cache do processo B"""
+    db_path = banco_compartilhado()
+    _, coerencia_a = processo(db_path)
+    cache_b, coerencia_b = processo(db_path)
+    cache_b.set('curso 1', b'curso 1', ['curso:1', 'cursos'], 0)
+    cache_b.set('curso 2', b'curso 2', ['curso:2'], 0)
+
+    # Sem escrita nova o sync não lê o diário
+    coerencia_b.sync()
+    assert coerencia_b.stats()['syncs'] == 0
+
+    escrever(db_path, coerencia_a, ['cursos', 'curso:1'])
+    assert cache_b.get('curso 1') == b'curso 1'  # Ainda não sincronizou
+    coerencia_b.sync()
+    print(f"Processo B depois da escrita de A: {coerencia_b.stats()}")
+    assert cache_b.get('curso 1') is None
+    assert cache_b.get('curso 2') == b'curso 2'
+    assert coerencia_b.stats()['writes_seen'] == 1 and coerencia_b.stats()['full_clears'] == 0
+    # O resultado de uma leitura anterior à escrita também não volta ao cache
+    assert cache_b.set('curso 1', b'antigo', ['curso:1', 'cursos'], 0) is False
+
+def test_lacuna_no_diario_limpa_o_cache():
+    """Se o diário foi podado além da última versão vista, o cache inteiro é descartado"""
+    db_path = banco_compartilhado()
+    _, coerencia_a = processo(db_path, log_size=1)
+    cache_b, coerencia_b = processo(db_path, log_size=1)
+    cache_b.set('curso 2', b'curso 2', ['curso:2'], 0)
+    cache_b.set('stats', b'stats', ['stats'], 0)
+
+    for _ in range(3):
+        escrever(db_path, coerencia_a, ['curso:1'])
+    coerencia_b.sync()
+    print(f"Processo B depois da lacuna: {coerencia_b.stats()}")
+    assert coerencia_b.stats()['full_clears'] == 1
+    assert coerencia_b.stats()['last_version'] == 3
+    assert cache_b.get('curso 2') is None and cache_b.get('stats') is None
+
+    # Depois da lacuna volta a aplicar o diário normalmente
+    cache_b.set('curso 2', b'curso 2', ['curso:2'], 3)
+    escrever(db_path, coerencia_a, ['curso:1'])
+    coerencia_b.sync()
+    assert coerencia_b.stats()['full_clears'] == 1
+    assert cache_b.get('curso 2') == b'curso 2'
+
+def test_etag_304_e_novo_etag_apos_escrita(client):
+    """If-None-Match com o ETag atual dá 304; depois de uma escrita o ETag muda"""
+    curso_id = client.post('/api/cursos', json={'titulo': 'ETag', 'total_aulas': 5}).get_json()['data']['id']
+
+    for url in (f'/api/cursos/{curso_id}', '/api/cursos', '/api/stats'):
+        primeira = client.get(url)
+        etag = primeira.headers['ETag']
+        assert primeira.status_code == 200 and etag
+
+        response = client.get(url, headers={'If-None-Match': etag})
+        print(f"{url} com If-None-Match - Status: {response.status_code}")
+        assert response.status_code == 304 and not response.get_data()
+        assert response.headers['ETag'] == etag
+
+        client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 1, 'concluida': False})
+        client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 1, 'concluida': True})
+        response = client.get(url, headers={'If-None-Match': etag})
+        print(f"{url} depois da escrita - Status: {response.status_code}, ETag: {response.headers['ETag']}")
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 1, 'concluida': False})
+
+    # Variantes da mesma URL têm ETags diferentes
+    assert client.get('/api/cursos?sort=titulo').headers['ETag'] != client.get('/api/cursos').headers['ETag']
+
+def test_cache_da_api_reflete_escrita(client):
+    """Uma resposta em cache não sobrevive a uma escrita no mesmo curso"""
+    curso_id = client.post('/api/cursos', json={'titulo': 'Cache', 'total_aulas': 5}).get_json()['data']['id']
+    assert client.get(f'/api/cursos/{curso_id}').get_json()['data']['aulas_concluidas'] == 0
+    assert client.get(f'/api/cursos/{curso_id}').get_json()['data']['aulas_concluidas'] == 0
+
+    client.post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 3, 'concluida': True})
+    data = client.get(f'/api/cursos/{curso_id}').get_json()['data']
+    assert data['aulas_concluidas'] == 1 and data['aulas_concluidas_list'] == [3]
+
+if __name__ == "__main__":
+    print("Testando o cache de respostas, a coerência entre processos e o ETag...")
+    test_invalidacao_por_tag()
+    test_set_antigo_recusado()
+    test_coerencia_entre_processos()
+    test_lacuna_no_diario_limpa_o_cache()
+    _, client, _ = preparar_app()
+    test_etag_304_e_novo_etag_apos_escrita(client)
+    test_cache_da_api_reflete_escrita(client)
+    print("OK")
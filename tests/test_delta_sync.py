@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+import time
+from conftest import preparar_app
+
+def versao_atual(client):
+    """Versão dos dados, lida do ETag da listagem ("v<versão>-...")"""
+    etag = client.get('/api/cursos').headers['ETag']
+    return int(etag.strip('W/"').split('-')[0][1:])
+
+def aulas_do_servidor(client, curso_id):
+    return set(client.get(f'/api/cursos/{curso_id}').get_json()['data']['aulas_concluidas_list'])
+
+def aplicar_delta(estado, delta):
+    """Aplica a resposta de /api/changes à cópia local {curso_id: set(aulas)}"""
+    for curso_id in delta['deleted']:
+        estado.pop(curso_id, None)
+    for curso in delta['upserted']:
+        estado.setdefault(curso['id'], set())
+    for aulas in delta['aulas']:
+        local = estado.setdefault(aulas['curso_id'], set())
+        local.update(aulas['marcadas'])
+        local.difference_update(aulas['desmarcadas'])
+    return estado
+
+def test_delta_atravessa_compactacao(app_module, client, db_path):
+    """changes_since(versão antiga) dá o estado final certo mesmo com o diário compactado"""
+    feed = app_module.event_feed
+    log_size = feed.log_size
+    feed.log_size = 3  # Quase todo o histórico vai para eventos_compactados
+    try:
+        inicio = versao_atual(client)
+        a = client.post('/api/cursos', json={'titulo': 'Delta A', 'total_aulas': 20}).get_json()['data']['id']
+        b = client.post('/api/cursos', json={'titulo': 'Delta B', 'total_aulas': 20}).get_json()['data']['id']
+        c = client.post('/api/cursos', json={'titulo': 'Delta C', 'total_aulas': 20}).get_json()['data']['id']
+
+        client.post(f'/api/cursos/{a}/aulas/range', json={'intervalos': [{'fim': 10, 'concluida': True}]})
+        client.post(f'/api/cursos/{a}/aulas/range', json={'intervalos': [{'inicio': 3, 'fim': 6, 'concluida': False}]})
+        client.post(f'/api/cursos/{b}/aula', json={'numero_aula': 7, 'concluida': True})
+
+        # Cópia local de um cliente que sincronizou no meio do histórico
+        meio = versao_atual(client)
+        local_meio = {curso_id: aulas_do_servidor(client, curso_id) for curso_id in (a, b, c)}
+
+        client.post(f'/api/cursos/{a}/aula', json={'numero_aula': 4, 'concluida': True})
+        client.post(f'/api/cursos/{a}/aula', json={'numero_aula': 10, 'concluida': False})
+        client.post(f'/api/cursos/{b}/aula', json={'numero_aula': 7, 'concluida': False})
+        client.post(f'/api/cursos/{b}/aula', json={'numero_aula': 8, 'concluida': True})
+        client.delete(f'/api/cursos/{c}')
+        for numero in range(11, 15):
+            client.post(f'/api/cursos/{a}/aula', json={'numero_aula': numero, 'concluida': True})
+
+        conn = sqlite3.connect(db_path)
+        compactados = conn.execute('SELECT COUNT(*) FROM eventos_compactados').fetchone()[0]
+        verbatim = conn.execute('SELECT COUNT(*) FROM eventos').fetchone()[0]
+        conn.close()
+        print(f"Eventos compactados: {compactados}, mantidos: {verbatim}")
+        assert compactados > 0 and verbatim <= 3
+
+        esperado = {a: aulas_do_servidor(client, a), b: aulas_do_servidor(client, b)}
+
+        # Direto no EventFeed
+        with app_module.db_manager.connection() as conn:
+            alteracoes = feed.changes_since(conn, inicio)
+        for curso_id in (a, b):
+            _, estado = alteracoes[curso_id]
+            assert set(estado.marcadas.numbers()) == esperado[curso_id]
+        assert alteracoes[c][0] == app_module.CURSO_REMOVIDO
+
+        # Pela API, partindo do início e do meio do histórico
+        for since, local in ((inicio, {}), (meio, local_meio)):
+            delta = client.get(f'/api/changes?since={since}').get_json()['data']
+            estado = aplicar_delta({k: set(v) for k, v in local.items()}, delta)
+            print(f"since={since}: {estado}")
+            assert c in delta['deleted'] and c not in estado
+            assert estado[a] == esperado[a] and estado[b] == esperado[b]
+    finally:
+        feed.log_size = log_size
+
+def test_long_poll_expira_sem_mudancas(client):
+    """wait sem nenhuma escrita: responde depois da espera, sem alterações e com a mesma versão"""
+    since = versao_atual(client)
+
+    inicio = time.monotonic()
+    response = client.get(f'/api/changes?since={since}&wait=1')
+    duracao = time.monotonic() - inicio
+    data = response.get_json()['data']
+    print(f"Long poll sem mudanças: {response.status_code} em {duracao:.2f}s")
+    assert response.status_code == 200 and duracao >= 1
+    assert data['version'] == since and not data['upserted'] and not data['aulas']
+
+def test_long_poll_acorda_com_escrita(app_module, client):
+    """wait com uma escrita durante a espera: responde logo, já com a mudança"""
+    curso_id = client.post('/api/cursos', json={'titulo': 'Long poll', 'total_aulas': 5}).get_json()['data']['id']
+    since = versao_atual(client)
+
+    def escrever():
+        time.sleep(0.3)
+        app_module.app.test_client().post(f'/api/cursos/{curso_id}/aula', json={'numero_aula': 2, 'concluida': True})
+    thread = threading.Thread(target=escrever)
+    thread.start()
+    inicio = time.monotonic()
+    data = client.get(f'/api/changes?since={since}&wait=10').get_json()['data']
+    duracao = time.monotonic() - inicio
+    thread.join()
+    print(f"Long poll com escrita: {duracao:.2f}s, aulas: {data['aulas']}")
+    assert duracao < 5
+    assert data['aulas'] == [{'curso_id': curso_id, 'marcadas': [2], 'desmarcadas': []}]
+
+def test_removidos_saem_do_historico_apos_retencao(app_module, client, db_path):
+    """Um curso removido some de eventos_compactados após a retenção; since anterior recebe 410"""
+    feed = app_module.event_feed
+    log_size, retencao = feed.log_size, feed.tombstone_retention
+    feed.log_size, feed.tombstone_retention = 1, 3
+    try:
+        outro = client.post('/api/cursos', json={'titulo': 'Retenção', 'total_aulas': 20}).get_json()['data']['id']
+        removido = client.post('/api/cursos', json={'titulo': 'Removido', 'total_aulas': 5}).get_json()['data']['id']
+        antes = versao_atual(client)
+        client.delete(f'/api/cursos/{removido}')
+        depois = versao_atual(client)
+
+        # Ainda dentro da retenção: o delta traz a remoção
+        client.post(f'/api/cursos/{outro}/aula', json={'numero_aula': 1, 'concluida': True})
+        assert removido in client.get(f'/api/changes?since={antes}').get_json()['data']['deleted']
+
+        for numero in range(2, 7):
+            client.post(f'/api/cursos/{outro}/aula', json={'numero_aula': numero, 'concluida': True})
+
+        conn = sqlite3.connect(db_path)
+        lapide = conn.execute('SELECT COUNT(*) FROM eventos_compactados WHERE curso_id = ?', (removido,)).fetchone()[0]
+        horizonte = conn.execute('SELECT version FROM eventos_horizonte WHERE id = 1').fetchone()[0]
+        conn.close()
+        print(f"Lápide mantida: {lapide}, horizonte: {horizonte}")
+        assert lapide == 0 and horizonte >= depois
+
+        response = client.get(f'/api/changes?since={antes}')
+        print(f"since={antes} anterior ao horizonte - Status: {response.status_code}")
+        assert response.status_code == 410
+        response = client.get(f'/api/changes?since={horizonte}')
+        assert response.status_code == 200
+        assert removido not in response.get_json()['data']['deleted']
+    finally:
+        feed.log_size, feed.tombstone_retention = log_size, retencao
+
+if __name__ == "__main__":
+    print("Testando a sincronização incremental (/api/changes)...")
+    app_module, client, db_path = preparar_app()
+    test_delta_atravessa_compactacao(app_module, client, db_path)
+    test_long_poll_expira_sem_mudancas(client)
+    test_long_poll_acorda_com_escrita(app_module, client)
+    test_removidos_saem_do_historico_apos_retencao(app_module, client, db_path)
+    print("OK")
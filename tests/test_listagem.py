@@ -0,0 +1,95 @@
+from conftest import preparar_app
+
+ORDENACOES = ('created_at', 'updated_at', 'titulo', 'progresso', 'tempo_restante')
+ORDENS = ('asc', 'desc')
+STATUS = ('concluido', 'em_andamento', 'nao_iniciado')
+
+def criar_cursos(client):
+    """
+    Cursos com muitos empates nas chaves de ordenação (mesmo título sem diferenciar
+    maiúsculas, mesmo progresso, mesmo tempo restante, criados no mesmo segundo),
+    que é onde um cursor keyset mal feito pula ou repete registros
+    """
+    cursos = [
+        ('Python', 10, 5, 0, 10), ('python', 10, 5, 0, 5), ('PYTHON', 4, 2, 0, 0),
+        ('Algoritmos', 8, 0, 40, 8), ('algoritmos', 8, 4, 0, 4), ('Banco de Dados', 6, 3, 0, 3),
+        ('Banco de Dados', 6, 3, 0, 0), ('Zebra', 2, 0, 0, 2), ('Árvores', 5, 1, 15, 1),
+        ('Redes', 12, 6, 0, 6), ('Redes', 12, 6, 0, 12), ('Compiladores', 3, 0, 0, 0)
+    ]
+    for titulo, total_aulas, horas, minutos, concluidas in cursos:
+        curso = client.post('/api/cursos', json={
+            'titulo': titulo, 'total_aulas': total_aulas, 'horas': horas, 'minutos': minutos
+        }).get_json()['data']
+        if concluidas:
+            client.post(f"/api/cursos/{curso['id']}/aulas/range", json={'intervalos': [{'fim': concluidas, 'concluida': True}]})
+
+def status_do_curso(curso):
+    if curso['aulas_concluidas'] <= 0:
+        return 'nao_iniciado'
+    return 'concluido' if curso['aulas_concluidas'] >= curso['total_aulas'] else 'em_andamento'
+
+def paginar(client, params, limit):
+    """Percorre a listagem página a página seguindo next_cursor"""
+    ids, after, paginas = [], None, 0
+    while True:
+        consulta = dict(params, limit=limit)
+        if after:
+            consulta['after'] = after
+        data = client.get('/api/cursos', query_string=consulta).get_json()['data']
+        ids.extend(curso['id'] for curso in data['cursos'])
+        paginas += 1
+        assert data['count'] == len(data['cursos']) <= limit
+        assert data['has_more'] == (data['next_cursor'] is not None)
+        if not data['has_more']:
+            return ids, paginas
+        after = data['next_cursor']
+        assert paginas < 1000
+
+def test_paginacao_keyset_igual_a_listagem_completa(client):
+    """Todas as combinações de sort × order × status: as páginas juntas dão a listagem sem limit"""
+    criar_cursos(client)
+    # Mais uma linha que muda updated_at de alguns cursos
+    client.post('/api/cursos/1/aula', json={'numero_aula': 1, 'concluida': True})
+
+    combinacoes = 0
+    for sort in ORDENACOES:
+        for order in ORDENS:
+            for status in STATUS + (None,):
+                params = {'sort': sort, 'order': order}
+                if status:
+                    params['status'] = status
+                completa = client.get('/api/cursos', query_string=params).get_json()['data']
+                esperado = [curso['id'] for curso in completa['cursos']]
+                assert not completa['has_more']
+                if status:
+                    assert all(status_do_curso(curso) == status for curso in completa['cursos'])
+
+                for limit in (1, 3):
+                    ids, paginas = paginar(client, params, limit)
+                    assert ids == esperado, f"{params} limit={limit}: {ids} != {esperado}"
+                    assert paginas == max(1, -(-len(esperado) // limit))
+                combinacoes += 1
+
+    # Os filtros de status particionam a listagem
+    todos = client.get('/api/cursos').get_json()['data']['cursos']
+    por_status = sum(client.get('/api/cursos', query_string={'status': status}).get_json()['data']['count'] for status in STATUS)
+    print(f"{combinacoes} combinações conferidas com {len(todos)} cursos")
+    assert por_status == len(todos)
+    assert {status_do_curso(curso) for curso in todos} == set(STATUS)
+
+def test_cursor_de_outra_ordenacao_recusado(client):
+    """Um cursor só vale para a ordenação em que foi gerado"""
+    data = client.get('/api/cursos', query_string={'sort': 'titulo', 'limit': 1}).get_json()['data']
+    assert data['next_cursor']
+    response = client.get('/api/cursos', query_string={'sort': 'titulo', 'order': 'desc', 'limit': 1, 'after': data['next_cursor']})
+    assert response.status_code == 400
+    response = client.get('/api/cursos', query_string={'sort': 'progresso', 'limit': 1, 'after': data['next_cursor']})
+    assert response.status_code == 400
+    assert client.get('/api/cursos', query_string={'after': 'nao-e-um-cursor'}).status_code == 400
+
+if __name__ == "__main__":
+    print("Testando a paginação keyset da listagem de cursos...")
+    _, client, _ = preparar_app()
+    test_paginacao_keyset_igual_a_listagem_completa(client)
+    test_cursor_de_outra_ordenacao_recusado(client)
+    print("OK")
@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from conftest import preparar_app
+from write_queue import WriteQueue, WriteRejected
+
+def nova_fila(db_path, **kwargs):
+    def factory():
+        return sqlite3.connect(db_path, check_same_thread=False)
+    conn = factory()
+    conn.execute('CREATE TABLE IF NOT EXISTS itens (valor INTEGER)')
+    conn.commit()
+    conn.close()
+    return WriteQueue(factory, **kwargs)
+
+def bloquear(fila):
+    """Ocupa a thread de escrita até o evento retornado ser liberado"""
+    liberar = threading.Event()
+    iniciou = threading.Event()
+    def operacao(conn):
+        iniciou.set()
+        liberar.wait(10)
+        return 'bloqueio', []
+    thread = threading.Thread(target=fila.submit, args=(operacao,))
+    thread.start()
+    iniciou.wait(5)
+    return liberar, thread
+
+def test_falha_isolada_no_grupo():
+    """Uma operação que falha desfaz só o próprio SAVEPOINT; as demais do grupo são gravadas"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'fila.sqlite')
+    mudancas_recebidas = []
+    fila = nova_fila(db_path, before_commit=lambda conn, mudancas: mudancas_recebidas.append(list(mudancas)))
+
+    def inserir(valor, falhar=False):
+        def operacao(conn):
+            conn.execute('INSERT INTO itens (valor) VALUES (?)', (valor,))
+            if falhar:
+                raise ValueError(f'falha proposital em {valor}')
+            return valor, [valor]
+        return operacao
+
+    # Segura a escrita para que as três operações entrem no mesmo grupo
+    liberar, bloqueio = bloquear(fila)
+    resultados = {}
+    def enviar(valor, falhar):
+        try:
+            resultados[valor] = fila.submit(inserir(valor, falhar))
+        except ValueError as e:
+            resultados[valor] = e
+    threads = [threading.Thread(target=enviar, args=(valor, valor == 2)) for valor in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    while fila.stats()['pending'] < 3:
+        time.sleep(0.01)
+    liberar.set()
+    for thread in threads + [bloqueio]:
+        thread.join()
+
+    conn = sqlite3.connect(db_path)
+    gravados = sorted(valor for (valor,) in conn.execute('SELECT valor FROM itens'))
+    conn.close()
+
+    print(f"Resultados: {resultados}")
+    print(f"Gravados: {gravados}, maior grupo: {fila.stats()['largest_group']}")
+    assert fila.stats()['largest_group'] == 3
+    assert resultados[1] == 1 and resultados[3] == 3
+    assert isinstance(resultados[2], ValueError)
+    assert gravados == [1, 3]
+    # before_commit recebe só as mudanças das operações que deram certo
+    assert sorted(mudancas_recebidas[-1]) == [1, 3]
+
+def test_admissao_recusa_fila_cheia():
+    """Com a fila cheia a escrita é recusada na hora, sem gravar nada"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'fila.sqlite')
+    fila = nova_fila(db_path, max_depth=1, deadline=5)
+
+    liberar, bloqueio = bloquear(fila)
+    espera = threading.Thread(target=fila.submit, args=(lambda conn: (None, []),))
+    espera.start()
+    while fila.stats()['pending'] < 1:
+        time.sleep(0.01)
+
+    try:
+        fila.submit(lambda conn: (conn.execute('INSERT INTO itens (valor) VALUES (99)'), []))
+        recusada = None
+    except WriteRejected as e:
+        recusada = e
+    liberar.set()
+    espera.join()
+    bloqueio.join()
+
+    print(f"Recusada: {recusada.reason if recusada else None}, Retry-After: {recusada.retry_after if recusada else None}")
+    assert recusada is not None and recusada.retry_after >= 1
+    assert fila.stats()['rejected_full'] == 1
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM itens WHERE valor = 99').fetchone()[0] == 0
+    conn.close()
+
+def test_api_503_quando_admissao_recusa(app_module, client):
+    """A API responde 503 com Retry-After quando a fila de escrita recusa a escrita"""
+    curso = client.post('/api/cursos', json={'titulo': 'Fila cheia', 'total_aulas': 5}).get_json()['data']
+
+    fila = app_module.write_queue
+    max_depth = fila.max_depth
+    fila.max_depth = 1
+    liberar, bloqueio = bloquear(fila)
+    espera = threading.Thread(target=fila.submit, args=(lambda conn: (None, []),))
+    espera.start()
+    while fila.stats()['pending'] < 1:
+        time.sleep(0.01)
+    try:
+        response = client.post(f"/api/cursos/{curso['id']}/aula", json={'numero_aula': 1, 'concluida': True})
+    finally:
+        liberar.set()
+        espera.join()
+        bloqueio.join()
+        fila.max_depth = max_depth
+
+    print(f"Status: {response.status_code}, Retry-After: {response.headers.get('Retry-After')}")
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    detalhe = client.get(f"/api/cursos/{curso['id']}").get_json()['data']
+    assert detalhe['aulas_concluidas'] == 0
+
+def test_api_lote_entre_cursos_tudo_ou_nada(client):
+    """/api/aulas/batch: um curso inexistente recusa o lote inteiro"""
+    curso = client.post('/api/cursos', json={'titulo': 'Lote', 'total_aulas': 5}).get_json()['data']
+
+    lote = {'cursos': [
+        {'curso_id': curso['id'], 'aulas': [{'numero_aula': 1, 'concluida': True}]},
+        {'curso_id': 987654, 'aulas': [{'numero_aula': 1, 'concluida': True}]}
+    ]}
+    response = client.post('/api/aulas/batch', json=lote)
+    print(f"Lote com curso inexistente - Status: {response.status_code}")
+    assert response.status_code == 404
+    assert client.get(f"/api/cursos/{curso['id']}").get_json()['data']['aulas_concluidas'] == 0
+
+    lote['cursos'].pop()
+    response = client.post('/api/aulas/batch', json=lote)
+    print(f"Lote válido - Status: {response.status_code}")
+    assert response.status_code == 200
+    assert client.get(f"/api/cursos/{curso['id']}").get_json()['data']['aulas_concluidas'] == 1
+
+def test_api_lote_entre_cursos_limita_aulas(app_module, client):
+    """/api/aulas/batch: o total de aulas distintas somado entre os cursos é limitado"""
+    limite = app_module.MAX_AULAS_INTERVALO
+    ids = [client.post('/api/cursos', json={'titulo': f'Lote grande {i}', 'total_aulas': limite}).get_json()['data']['id'] for i in range(2)]
+    aulas = [{'numero_aula': numero, 'concluida': True} for numero in range(1, limite // 2 + 2)]
+
+    # Repetições da mesma aula não contam
+    lote = {'cursos': [{'curso_id': ids[0], 'aulas': aulas[:10] + aulas[:10]}]}
+    assert client.post('/api/aulas/batch', json=lote).status_code == 200
+
+    lote = {'cursos': [{'curso_id': curso_id, 'aulas': aulas} for curso_id in ids]}
+    response = client.post('/api/aulas/batch', json=lote)
+    print(f"Lote acima do limite - Status: {response.status_code}, {response.get_json()}")
+    assert response.status_code == 400
+    assert client.get(f"/api/cursos/{ids[1]}").get_json()['data']['aulas_concluidas'] == 0
+
+if __name__ == "__main__":
+    print("Testando a fila de escrita (group commit e controle de admissão)...")
+    test_falha_isolada_no_grupo()
+    test_admissao_recusa_fila_cheia()
+    app_module, client, _ = preparar_app()
+    test_api_503_quando_admissao_recusa(app_module, client)
+    test_api_lote_entre_cursos_tudo_ou_nada(client)
+    test_api_lote_entre_cursos_limita_aulas(app_module, client)
+    print("OK")